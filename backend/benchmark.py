@@ -0,0 +1,435 @@
+"""Offline throughput benchmark.
+
+Drives check_email, find_email_with_scraping and the two bulk job pipelines
+against a local fake MX server, a stub DNS resolver and a stub search page,
+so no real mail server or search engine is contacted:
+
+    python benchmark.py --rows 5000 --latency 0.02 --greylist 0.05
+
+The fake MX answers on several loopback addresses (127.0.0.x, one MX
+"provider" each; Linux routes all of 127/8 to lo, elsewhere add aliases or
+use --mx-hosts 1). Addresses are valid, rejected (550), greylisted once (451),
+accepted anyway (catch-all domains) or never answered (timeout domains)
+according to the generated data set; some domains have no MX at all.
+Session caps and rate limits per provider (MAX_SESSIONS_PER_PROVIDER,
+MX_RATE_PER_SEC, MX_BURST) apply as configured.
+
+Each scenario runs in a fresh process, on its own data set and its own
+throwaway database on MONGO_URL (for the verdict cache, job rows and learned
+patterns), dropped at the end. It reports rows/sec, p50/p99 latency per
+address or person, and peak memory: the peak RSS of its process, or with
+--trace-memory the peak of Python allocations during the run.
+"""
+import argparse
+import asyncio
+import csv
+import hashlib
+import multiprocessing
+import os
+import random
+import resource
+import time
+import tracemalloc
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional, Set, Tuple
+from urllib.parse import parse_qs, urlparse
+
+# Share of domains of each kind; the rest answer normally
+CATCH_ALL_SHARE = 0.05
+NO_MX_SHARE = 0.02
+TIMEOUT_SHARE = 0.01
+
+# Share of verification rows that are valid, junk (bad syntax, disposable, role) or repeats
+VALID_SHARE = 0.3
+JUNK_SHARE = 0.07
+REPEAT_SHARE = 0.08
+
+# Share of people whose address follows no known format and is only found by scraping
+IRREGULAR_SHARE = 0.2
+# Filler text making up a stub search page
+SEARCH_PAGE_PARAGRAPHS = 200
+
+FIRST_NAMES = ["ann", "bob", "carla", "dev", "eve", "farid", "gina", "hugo", "ines", "jon", "kim", "lena"]
+LAST_NAMES = ["adams", "brown", "chen", "diaz", "evans", "fox", "garcia", "hill", "ito", "jones", "khan", "lopez"]
+FORMATS = ["first.last", "first", "firstlast", "f.last", "flast", "last.first", "first_last"]
+
+SCENARIOS = ("check_email", "find_email_with_scraping", "process_bulk_verification", "process_bulk_finding")
+
+
+def _fraction(value: str) -> float:
+    """Deterministic number in [0, 1) for a string."""
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), 'big') / 2 ** 64
+
+
+class FakeWorld:
+    """Domains, their MX hosts and which addresses exist, shared by the fake MX, resolver and search page."""
+
+    def __init__(self, mx_hosts: List[str], greylist: float, dns_latency: float, search_latency: float):
+        self.mx_hosts = mx_hosts
+        self.greylist = greylist
+        self.dns_latency = dns_latency
+        self.search_latency = search_latency
+        self.valid: Set[str] = set()
+        self.catch_all: Set[str] = set()
+        self.no_mx: Set[str] = set()
+        self.timeout: Set[str] = set()
+        self.greylisted: Set[str] = set()
+        # Addresses a search for (first, last, domain) turns up
+        self.pages: Dict[Tuple[str, str, str], List[str]] = {}
+
+    def add_domains(self, tag: str, count: int, rng: random.Random) -> List[str]:
+        domains = []
+        for i in range(count):
+            domain = f"{tag}{i}.bench.test"
+            roll = rng.random()
+            if roll < CATCH_ALL_SHARE:
+                self.catch_all.add(domain)
+            elif roll < CATCH_ALL_SHARE + NO_MX_SHARE:
+                self.no_mx.add(domain)
+            elif roll < CATCH_ALL_SHARE + NO_MX_SHARE + TIMEOUT_SHARE:
+                self.timeout.add(domain)
+            domains.append(domain)
+        return domains
+
+    def rcpt_code(self, address: str) -> Optional[int]:
+        """Reply to RCPT TO, None to never answer."""
+        domain = address.rsplit('@', 1)[-1]
+        if domain in self.timeout:
+            return None
+        if address not in self.greylisted and _fraction(address) < self.greylist:
+            self.greylisted.add(address)
+            return 451
+        if domain in self.catch_all or address in self.valid:
+            return 250
+        return 550
+
+    async def resolve_mx(self, domain: str, timeout: float = 10) -> List[str]:
+        await asyncio.sleep(self.dns_latency)
+        if domain in self.no_mx:
+            return []
+        return [self.mx_hosts[int(_fraction(domain) * len(self.mx_hosts))]]
+
+    def search_page(self, url: str) -> bytes:
+        """Stub search results page for a scraper query URL."""
+        time.sleep(self.search_latency)
+        query = parse_qs(urlparse(url).query).get('q', [''])[0]
+        quoted = query.split('"')
+        name, domain = quoted[1].lower().split(' ', 1), quoted[3].lower()
+        emails = self.pages.get((name[0], name[1], domain), [])
+        filler = "<p>Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod tempor.</p>"
+        body = filler * SEARCH_PAGE_PARAGRAPHS + "".join(f"<div>Contact: {email}</div>" for email in emails)
+        return f"<html><head><script>var x = 'a@b.co';</script></head><body>{body}</body></html>".encode()
+
+
+class FakeMX:
+    """SMTP server answering RCPT TO the way FakeWorld says, with a fixed delay per command."""
+
+    def __init__(self, world: FakeWorld, latency: float):
+        self.world = world
+        self.latency = latency
+        self.servers: List[asyncio.AbstractServer] = []
+        self.port = 0
+
+    async def start(self) -> "FakeMX":
+        for host in self.world.mx_hosts:
+            server = await asyncio.start_server(self.handle, host, self.port, backlog=4096)
+            self.port = server.sockets[0].getsockname()[1]
+            self.servers.append(server)
+        return self
+
+    async def close(self):
+        for server in self.servers:
+            server.close()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            writer.write(b"220 fake ESMTP\r\n")
+            while True:
+                line = await reader.readline()
+                if not line:
+                    return
+                command = line.decode('latin-1').strip()
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+                verb = command[:4].upper()
+                if verb == "RCPT":
+                    code = self.world.rcpt_code(command.split('<', 1)[1].rstrip('>').lower())
+                    if code is None:
+                        # Hold the connection open without answering until the client gives up
+                        await reader.read()
+                        return
+                    writer.write(f"{code} {'ok' if code == 250 else 'no'}\r\n".encode())
+                elif verb == "QUIT":
+                    writer.write(b"221 bye\r\n")
+                    await writer.drain()
+                    return
+                else:
+                    writer.write(b"250 ok\r\n")
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+
+class FakeResponse:
+    def __init__(self, content: bytes):
+        self.status_code = 200
+        self.content = content
+
+
+class FakeSearchSession:
+    def __init__(self, world: FakeWorld):
+        self.world = world
+
+    def get(self, url: str, timeout: float = None) -> FakeResponse:
+        return FakeResponse(self.world.search_page(url))
+
+
+def verification_rows(world: FakeWorld, tag: str, count: int, rng: random.Random) -> List[str]:
+    domains = world.add_domains(tag, max(count // 25, 10), rng)
+    emails: List[str] = []
+    for i in range(count):
+        roll = rng.random()
+        if emails and roll < REPEAT_SHARE:
+            emails.append(rng.choice(emails))
+            continue
+        domain = rng.choice(domains)
+        if roll < REPEAT_SHARE + JUNK_SHARE:
+            emails.append(rng.choice([f"user{i} at {domain}", f"user{i}@mailinator.com", f"info@{domain}"]))
+            continue
+        email = f"{rng.choice(FIRST_NAMES)}.{rng.choice(LAST_NAMES)}{i}@{domain}"
+        if rng.random() < VALID_SHARE:
+            world.valid.add(email)
+        emails.append(email)
+    return emails
+
+
+def finding_rows(world: FakeWorld, tag: str, count: int, rng: random.Random) -> List[Tuple[str, str, str]]:
+    from pattern_model import render
+
+    domains = world.add_domains(tag, max(count // 5, 5), rng)
+    formats = {domain: rng.choice(FORMATS) for domain in domains}
+    people = []
+    for i in range(count):
+        first, last, domain = rng.choice(FIRST_NAMES), f"{rng.choice(LAST_NAMES)}{i}", rng.choice(domains)
+        if rng.random() < IRREGULAR_SHARE:
+            email = f"{first}-{last}-{i % 7}@{domain}"
+        else:
+            email = render(formats[domain], first, last, domain)
+        world.valid.add(email)
+        world.pages[(first, last, domain)] = [f"press@{domain}", email]
+        people.append((first, last, domain))
+    return people
+
+
+def percentile(values: List[float], share: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(share * len(ordered)), len(ordered) - 1)]
+
+
+class Recorder:
+    """Per-call latencies of an async function, while it is patched into a module."""
+
+    def __init__(self, module, name: str):
+        self.module = module
+        self.name = name
+        self.original = getattr(module, name)
+        self.latencies: List[float] = []
+
+    def __enter__(self) -> "Recorder":
+        async def timed_call(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await self.original(*args, **kwargs)
+            finally:
+                self.latencies.append(time.perf_counter() - started)
+
+        setattr(self.module, self.name, timed_call)
+        return self
+
+    def __exit__(self, *exc):
+        setattr(self.module, self.name, self.original)
+
+
+async def run_scenario(name: str, rows: int, run: Callable, trace_memory: bool) -> Dict:
+    if trace_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    latencies, timings = await run()
+    elapsed = time.perf_counter() - started
+    if trace_memory:
+        peak_mb = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        tracemalloc.stop()
+    else:
+        peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return {
+        "scenario": name,
+        "rows": rows,
+        "seconds": elapsed,
+        "rows_per_sec": rows / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 0.5) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "peak_mb": peak_mb,
+        "timings": timings,
+    }
+
+
+async def benchmark(args) -> List[Dict]:
+    # Imported here so the environment set up in main() is what the server module sees
+    import domain_cache as domain_cache_module
+    import retry_queue
+    import server
+    import smtp_probe
+    from metrics import job_timings
+    from scraper import scraper
+    from verdict_cache import CacheLookup
+    from csv_stream import upload_path
+
+    rng = random.Random(args.seed)
+    world = FakeWorld(
+        [f"127.0.0.{i + 1}" for i in range(args.mx_hosts)], args.greylist, args.dns_latency, args.search_latency
+    )
+    mx = await FakeMX(world, args.latency).start()
+    smtp_probe.SMTP_PORT = mx.port
+    smtp_probe.SMTP_TIMEOUT = args.smtp_timeout
+    domain_cache_module.resolve_mx = world.resolve_mx
+    server.GREYLIST_RETRY_DELAY = args.greylist_delay
+    retry_queue.RETRY_BASE_DELAY = args.greylist_delay
+    search_session = FakeSearchSession(world)
+    scraper._session = lambda proxy_url: search_session
+
+    async def bounded(calls, concurrency: int):
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def call(coro):
+            async with semaphore:
+                return await coro
+
+        return await asyncio.gather(*(call(coro) for coro in calls))
+
+    async def single_checks():
+        emails = verification_rows(world, "single", args.single_rows, rng)
+        with Recorder(server, "check_email") as recorder, job_timings() as timings:
+            await bounded((server.check_email(email) for email in emails), args.concurrency)
+        return recorder.latencies, timings
+
+    async def single_finds():
+        people = finding_rows(world, "find", args.find_rows, rng)
+        with Recorder(server, "find_email_with_scraping") as recorder, job_timings() as timings:
+            await bounded((server.find_email_with_scraping(*person) for person in people), args.concurrency)
+        return recorder.latencies, timings
+
+    async def bulk_job(job_type: str, header: List[str], rows: List[List[str]], call: str):
+        job_id = str(uuid.uuid4())
+        path = upload_path(job_id)
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(header)
+            writer.writerows(rows)
+        await server.job_store.create_job(job_id, job_type, path.name, len(rows), "benchmark")
+        with Recorder(server, call) as recorder, job_timings() as timings:
+            if job_type == 'verify':
+                await server.process_bulk_verification(job_id, path, 'email', len(rows), CacheLookup())
+            else:
+                await server.process_bulk_finding(job_id, path, len(rows), CacheLookup())
+        path.unlink(missing_ok=True)
+        job = await server.job_store.get_job(job_id)
+        if job['status'] != 'completed':
+            raise RuntimeError(f"{job_type} job ended {job['status']}: {job['log']}")
+        return recorder.latencies, timings
+
+    async def bulk_verification():
+        emails = verification_rows(world, "bulkv", args.rows, rng)
+        return await bulk_job('verify', ['email'], [[email] for email in emails], "check_email")
+
+    async def bulk_finding():
+        people = finding_rows(world, "bulkf", args.bulk_find_rows, rng)
+        return await bulk_job(
+            'find', ['firstname', 'lastname', 'domain'], [list(person) for person in people], "find_email_with_scraping"
+        )
+
+    scenarios = [
+        ("check_email", args.single_rows, single_checks),
+        ("find_email_with_scraping", args.find_rows, single_finds),
+        ("process_bulk_verification", args.rows, bulk_verification),
+        ("process_bulk_finding", args.bulk_find_rows, bulk_finding),
+    ]
+    results = []
+    try:
+        for name, rows, run in scenarios:
+            if args.only and name not in args.only:
+                continue
+            results.append(await run_scenario(name, rows, run, args.trace_memory))
+    finally:
+        await mx.close()
+        await smtp_probe.smtp_pool.close()
+        if not args.keep_db:
+            await server.client.drop_database(server.db.name)
+        server.client.close()
+    return results
+
+
+def run_in_process(args, name: str) -> Dict:
+    """Run one scenario; called in a fresh process, so its peak RSS is the scenario's alone."""
+    os.environ.setdefault('DB_NAME', 'helpfinder')
+    os.environ['DB_NAME'] = f"{os.environ['DB_NAME']}_benchmark_{os.getpid()}"
+    # Domain verdicts must come from the stub resolver, not from an earlier run
+    os.environ['DOMAIN_CACHE_PERSIST'] = 'false'
+    args.only = [name]
+    return asyncio.run(benchmark(args))[0]
+
+
+def report(results: List[Dict], show_timings: bool):
+    memory = "peak MB"
+    print(f"{'scenario':<28}{'rows':>8}{'seconds':>10}{'rows/s':>10}{'p50 ms':>10}{'p99 ms':>10}{memory:>10}")
+    for result in results:
+        print(
+            f"{result['scenario']:<28}{result['rows']:>8}{result['seconds']:>10.2f}{result['rows_per_sec']:>10.1f}"
+            f"{result['p50_ms']:>10.1f}{result['p99_ms']:>10.1f}{result['peak_mb']:>10.1f}"
+        )
+    if show_timings:
+        for result in results:
+            print(f"\n{result['scenario']} stages:")
+            for stage, summary in result['timings'].summary().items():
+                print(
+                    f"  {stage:<20}{summary['count']:>8} calls{summary['total_s']:>10.2f}s total"
+                    f"{summary['avg_ms']:>10.1f}ms avg{summary['max_ms']:>10.1f}ms max"
+                )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark verification/finding against a local fake MX")
+    parser.add_argument('--rows', type=int, default=5000, help="rows in the bulk verification job")
+    parser.add_argument('--single-rows', type=int, default=1000, help="addresses passed to check_email")
+    parser.add_argument('--find-rows', type=int, default=200, help="people passed to find_email_with_scraping")
+    parser.add_argument('--bulk-find-rows', type=int, default=50, help="rows in the bulk finding job")
+    parser.add_argument('--concurrency', type=int, default=50, help="concurrent check_email/find calls")
+    parser.add_argument('--mx-hosts', type=int, default=20, help="loopback addresses the fake MX listens on")
+    parser.add_argument('--latency', type=float, default=0.01, help="fake MX delay per SMTP command (seconds)")
+    parser.add_argument('--dns-latency', type=float, default=0.02, help="stub resolver delay (seconds)")
+    parser.add_argument('--search-latency', type=float, default=0.2, help="stub search page delay (seconds)")
+    parser.add_argument('--greylist', type=float, default=0.03, help="share of addresses greylisted once")
+    parser.add_argument('--greylist-delay', type=float, default=1.0, help="delay before retrying a greylisted address")
+    parser.add_argument('--smtp-timeout', type=float, default=2.0, help="SMTP timeout, hit by the timeout domains")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--only', nargs='*', choices=SCENARIOS, help="scenarios to run (default: all)")
+    parser.add_argument('--trace-memory', action='store_true', help="report peak Python allocations per scenario")
+    parser.add_argument('--timings', action='store_true', help="also print the time spent per stage")
+    parser.add_argument('--keep-db', action='store_true', help="keep the benchmark database")
+    args = parser.parse_args()
+
+    results = []
+    for name in SCENARIOS:
+        if args.only and name not in args.only:
+            continue
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+            results.append(pool.submit(run_in_process, args, name).result())
+    report(results, args.timings)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+import hashlib
+import logging
+import mmap
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+# Lists loaded from files (one entry per line, '#' comments); the built-in entries apply when unset
+DISPOSABLE_DOMAINS_FILE = os.environ.get('DISPOSABLE_DOMAINS_FILE')
+ROLE_PREFIXES_FILE = os.environ.get('ROLE_PREFIXES_FILE')
+
+DEFAULT_DISPOSABLE_DOMAINS = ("mailinator.com", "10minutemail.com", "guerrillamail.com", "tempmail.org")
+DEFAULT_ROLE_PREFIXES = ("info", "support", "admin", "sales", "contact", "noreply", "no-reply")
+
+# Compiled (sorted) copies of the list files, shared by every worker process through the page cache
+INDEX_DIR = Path(os.environ.get('BLOCKLIST_INDEX_DIR', Path(tempfile.gettempdir()) / 'helpfinder-blocklists'))
+
+# Seconds between checks of a list file for changes
+RELOAD_CHECK_INTERVAL = 30
+
+
+def _normalise(entries: Iterable[str]) -> bytes:
+    """Sorted, distinct, lower-cased entries as a newline-delimited block (with a leading newline)."""
+    lines = set()
+    for entry in entries:
+        entry = entry.split('#', 1)[0].strip().lower().lstrip('.')
+        if entry:
+            lines.add(entry.encode('utf-8'))
+    return b"\n" + b"\n".join(sorted(lines)) + b"\n" if lines else b""
+
+
+class SortedIndex:
+    """Membership tests over a sorted, newline-delimited byte block.
+
+    The block is usually a memory-mapped file, so every worker process shares one
+    copy of a large list instead of building its own set; lookups binary-search
+    line boundaries in place.
+    """
+
+    def __init__(self, data, size: int):
+        self._data = data
+        self.size = size
+        self._entries: Optional[int] = None
+
+    def __contains__(self, key: str) -> bool:
+        data = self._data
+        target = key.encode('utf-8', 'surrogateescape')
+        # Searched lines start at lo and end at the newline at hi
+        lo, hi = 1, self.size - 1
+        while lo <= hi:
+            start = data.rfind(b"\n", lo - 1, (lo + hi) // 2) + 1
+            end = data.find(b"\n", start)
+            line = data[start:end]
+            if line == target:
+                return True
+            if line < target:
+                lo = end + 1
+            else:
+                hi = start - 1
+        return False
+
+    @property
+    def entries(self) -> int:
+        if self._entries is None:
+            self._entries = max(_count_lines(self._data, self.size) - 1, 0)
+        return self._entries
+
+
+class Blocklist:
+    """A hot-reloadable list of domains or local parts.
+
+    Entries come from `path` when it is set, else from `defaults`. The file is
+    compiled once into a sorted index under INDEX_DIR (named after the file's
+    path, size and mtime, so concurrent workers reuse the same one) and
+    memory-mapped lazily on first use. Edits to the file are picked up within
+    RELOAD_CHECK_INTERVAL seconds, by every process, without a restart.
+
+    With `match_suffixes`, a key also matches when any parent domain is listed,
+    so `x.mailinator.com` is caught by `mailinator.com`.
+    """
+
+    def __init__(self, name: str, path: Optional[str], defaults: Iterable[str], match_suffixes: bool = False):
+        self.name = name
+        self.path = Path(path) if path else None
+        self.match_suffixes = match_suffixes
+        defaults_block = _normalise(defaults)
+        self._defaults = SortedIndex(defaults_block, len(defaults_block))
+        self._index: Optional[SortedIndex] = None
+        self._signature = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def __contains__(self, key: str) -> bool:
+        index = self._current()
+        key = key.strip().lower()
+        if not key:
+            return False
+        if key in index:
+            return True
+        if self.match_suffixes:
+            labels = key.split('.')
+            # Parent domains down to the registrable part; a bare TLD never matches
+            for i in range(1, len(labels) - 1):
+                if '.'.join(labels[i:]) in index:
+                    return True
+        return False
+
+    def _current(self) -> SortedIndex:
+        if self.path is None:
+            return self._defaults
+        now = time.monotonic()
+        if self._index is None or now - self._checked_at >= RELOAD_CHECK_INTERVAL:
+            with self._lock:
+                if self._index is None or now - self._checked_at >= RELOAD_CHECK_INTERVAL:
+                    self._checked_at = now
+                    self._reload_if_changed()
+        return self._index or self._defaults
+
+    def _reload_if_changed(self):
+        try:
+            st = self.path.stat()
+        except OSError as e:
+            if self._index is None:
+                logger.warning(f"{self.name} list {self.path} unreadable, using built-in entries: {e}")
+                self._index = self._defaults
+            return
+        signature = (st.st_size, st.st_mtime_ns)
+        if signature == self._signature:
+            return
+        try:
+            index = self._open(self._compile(signature))
+        except (OSError, UnicodeDecodeError) as e:
+            logger.warning(f"Failed to load {self.name} list {self.path}: {e}")
+            if self._index is None:
+                self._index = self._defaults
+            return
+        # The previous index is unmapped once no lookup holds it any more
+        self._index, self._signature = index, signature
+        logger.info(f"Loaded {index.entries} {self.name} entries from {self.path}")
+
+    def _compile(self, signature) -> Path:
+        source = hashlib.sha1(str(self.path.resolve()).encode()).hexdigest()[:12]
+        index_path = INDEX_DIR / f"{self.name}-{source}-{signature[0]}-{signature[1]}.idx"
+        if index_path.exists():
+            return index_path
+        INDEX_DIR.mkdir(parents=True, exist_ok=True)
+        with open(self.path, encoding='utf-8') as f:
+            block = _normalise(f)
+        # Write-then-rename, so a worker never maps a half-written index
+        fd, tmp = tempfile.mkstemp(dir=INDEX_DIR, prefix=f".{self.name}-")
+        with os.fdopen(fd, 'wb') as out:
+            out.write(block)
+        os.replace(tmp, index_path)
+        # Indexes of earlier versions of the file stay valid for processes that still map them
+        for stale in INDEX_DIR.glob(f"{self.name}-{source}-*.idx"):
+            if stale != index_path:
+                stale.unlink(missing_ok=True)
+        return index_path
+
+    @staticmethod
+    def _open(index_path: Path) -> SortedIndex:
+        with open(index_path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size == 0:
+                return SortedIndex(b"", 0)
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return SortedIndex(data, size)
+
+    def reload(self):
+        """Check the list file for changes now, instead of at the next interval."""
+        if self.path is None:
+            return
+        with self._lock:
+            self._checked_at = time.monotonic()
+            self._reload_if_changed()
+
+    def stats(self) -> Dict[str, object]:
+        index = self._current()
+        return {
+            "source": str(self.path) if self.path else "built-in",
+            "entries": index.entries,
+            "bytes": index.size,
+        }
+
+
+def _count_lines(data, size: int, chunk: int = 1 << 20) -> int:
+    return sum(data[pos:pos + chunk].count(b"\n") for pos in range(0, size, chunk))
+
+
+disposable_domains = Blocklist("disposable", DISPOSABLE_DOMAINS_FILE, DEFAULT_DISPOSABLE_DOMAINS, match_suffixes=True)
+role_prefixes = Blocklist("role", ROLE_PREFIXES_FILE, DEFAULT_ROLE_PREFIXES)
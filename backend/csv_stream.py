@@ -0,0 +1,78 @@
+import csv
+import io
+import os
+import shutil
+import tempfile
+import zlib
+from pathlib import Path
+from typing import Any, AsyncIterator, BinaryIO, Dict, Iterator, List, Sequence, Tuple
+
+# Uploaded CSVs are spooled here while their job runs
+UPLOAD_DIR = Path(os.environ.get('UPLOAD_DIR', Path(tempfile.gettempdir()) / 'helpfinder-uploads'))
+
+# Largest bulk upload accepted, in data rows
+MAX_BULK_ROWS = int(os.environ.get('MAX_BULK_ROWS', 1_000_000))
+
+# Bytes of CSV text buffered before a chunk is sent to the client
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+
+def upload_path(job_id: str) -> Path:
+    UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+    return UPLOAD_DIR / f"{job_id}.csv"
+
+
+def spool_csv(source: BinaryIO, dest: Path) -> Tuple[List[str], int]:
+    """Copy an upload to `dest` and scan it once for its header and data row count.
+
+    Both passes work on fixed-size buffers, so memory use does not depend on the
+    size of the file.
+    """
+    source.seek(0)
+    with open(dest, 'wb') as out:
+        shutil.copyfileobj(source, out)
+
+    with open(dest, newline='', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        fieldnames = next(reader, [])
+        # csv.DictReader skips blank lines, count the same way
+        total = sum(1 for row in reader if row)
+    return fieldnames, total
+
+
+def read_header(path: Path) -> List[str]:
+    with open(path, newline='', encoding='utf-8') as f:
+        return next(csv.reader(f), [])
+
+
+def iter_csv_rows(path: Path) -> Iterator[Dict]:
+    with open(path, newline='', encoding='utf-8') as f:
+        yield from csv.DictReader(f)
+
+
+async def stream_csv(
+    rows: AsyncIterator[Sequence[Any]], header: List[str], first_rows: List[Sequence[Any]] = ()
+) -> AsyncIterator[bytes]:
+    """Encode value rows as CSV chunks as they arrive, never holding more than one chunk."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    for row in first_rows:
+        writer.writerow(row)
+    async for row in rows:
+        writer.writerow(row)
+        if buffer.tell() >= EXPORT_CHUNK_SIZE:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+async def gzip_stream(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    compressor = zlib.compressobj(wbits=31)  # gzip container
+    async for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
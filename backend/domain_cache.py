@@ -0,0 +1,196 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from metrics import CACHE_REQUESTS, timed
+from smtp_probe import resolve_mx, smtp_pool, SOFT_FAIL_CODES
+
+logger = logging.getLogger(__name__)
+
+DOMAIN_CACHE_SIZE = 50000
+
+# MX lookups run at once when pre-resolving a bulk job's domains
+DNS_CONCURRENCY = 100
+# Catch-all probes run at once when pre-checking a find job's domains (the SMTP pool still caps sessions)
+CATCH_ALL_CONCURRENCY = 20
+
+# Seconds each kind of domain verdict stays fresh
+MX_TTL = 3600
+NO_MX_TTL = 600
+DNS_ERROR_TTL = 60
+CATCH_ALL_TTL = 6 * 3600
+SOFT_FAIL_TTL = 120
+
+# Catch-all probe outcomes
+CATCH_ALL = "catch_all"
+NOT_CATCH_ALL = "not_catch_all"
+SOFT_FAIL = "soft_fail"
+
+CATCH_ALL_SENDER = "verifier@example.com"
+
+_MISSING = object()
+
+
+class TTLCache:
+    """In-process LRU cache whose entries also expire after a per-entry TTL."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._data: "OrderedDict[str, Tuple[Any, float]]" = OrderedDict()
+
+    def get(self, key: str, default: Any = _MISSING) -> Any:
+        item = self._data.get(key)
+        if item is None:
+            return default
+        value, expires = item
+        if expires <= time.monotonic():
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any, ttl: float):
+        self._data[key] = (value, time.monotonic() + ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class DomainCache:
+    """Per-domain MX and catch-all verdicts, shared by every check in the process.
+
+    Concurrent lookups for the same domain wait on a single in-flight load, so a
+    bulk job does one DNS query and one catch-all probe per distinct domain.
+    When a Mongo collection is given, verdicts are also persisted there with a
+    TTL index so other workers and restarts can reuse them.
+    """
+
+    def __init__(self, collection=None, max_entries: int = DOMAIN_CACHE_SIZE):
+        self.collection = collection
+        self._memory = TTLCache(max_entries)
+        self._inflight: Dict[str, asyncio.Task] = {}
+
+    async def ensure_indexes(self):
+        if self.collection is None:
+            return
+        try:
+            await self.collection.create_index("expires_at", expireAfterSeconds=0)
+        except Exception as e:
+            logger.warning(f"Could not create domain cache index: {e}")
+
+    async def get_mx(self, domain: str) -> Optional[List[str]]:
+        """MX hosts for the domain; an empty list means it has no MX, None that the lookup failed (timeout, SERVFAIL)."""
+        async def load():
+            try:
+                with timed("dns"):
+                    records = await resolve_mx(domain)
+            except Exception as e:
+                logger.info(f"MX lookup failed for {domain}: {e!r}")
+                return None, DNS_ERROR_TTL
+            return records, MX_TTL if records else NO_MX_TTL
+
+        return await self._get_or_load(f"mx:{_normalise(domain)}", load)
+
+    async def prefetch_mx(self, domains: Iterable[str], concurrency: int = DNS_CONCURRENCY) -> Set[str]:
+        """Resolve MX for many domains concurrently; returns the (normalised) domains without MX.
+
+        Domains whose lookup failed are not among them, their rows are checked one by one.
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+        dead = set()
+
+        async def resolve(domain: str):
+            async with semaphore:
+                if await self.get_mx(domain) == []:
+                    dead.add(domain)
+
+        await asyncio.gather(*(resolve(domain) for domain in {_normalise(d) for d in domains}))
+        return dead
+
+    async def prefetch_catch_all(self, domains: Iterable[str], concurrency: int = CATCH_ALL_CONCURRENCY) -> Set[str]:
+        """Probe many domains for catch-all concurrently; returns the (normalised) catch-all ones."""
+        semaphore = asyncio.Semaphore(concurrency)
+        catch_all = set()
+
+        async def probe(domain: str):
+            async with semaphore:
+                records = await self.get_mx(domain)
+                if records and await self.get_catch_all(domain, records) == CATCH_ALL:
+                    catch_all.add(domain)
+
+        await asyncio.gather(*(probe(domain) for domain in {_normalise(d) for d in domains}))
+        return catch_all
+
+    async def get_catch_all(self, domain: str, mx_hosts: List[str]) -> str:
+        """One of CATCH_ALL, NOT_CATCH_ALL or SOFT_FAIL for the domain."""
+        async def load():
+            probe = f"doesnotexist123@{domain}"
+            with timed("catch_all"):
+                code = (await smtp_pool.probe_mx(mx_hosts, CATCH_ALL_SENDER, [probe]))[probe]
+            if code == 250:
+                return CATCH_ALL, CATCH_ALL_TTL
+            if code is None or code in SOFT_FAIL_CODES:
+                return SOFT_FAIL, SOFT_FAIL_TTL
+            return NOT_CATCH_ALL, CATCH_ALL_TTL
+
+        return await self._get_or_load(f"catch_all:{_normalise(domain)}", load)
+
+    async def _get_or_load(self, key: str, load: Callable[[], Awaitable[Tuple[Any, float]]]) -> Any:
+        cache = key.split(':', 1)[0]
+        value = self._memory.get(key)
+        if value is not _MISSING:
+            CACHE_REQUESTS.inc(cache=cache, result="hit")
+            return value
+        task = self._inflight.get(key)
+        if task is None:
+            CACHE_REQUESTS.inc(cache=cache, result="miss")
+            task = asyncio.ensure_future(self._load(key, load))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            CACHE_REQUESTS.inc(cache=cache, result="hit")
+        return await asyncio.shield(task)
+
+    async def _load(self, key: str, load: Callable[[], Awaitable[Tuple[Any, float]]]) -> Any:
+        doc = await self._read_persistent(key)
+        if doc is not None:
+            ttl = (doc["expires_at"] - datetime.utcnow()).total_seconds()
+            self._memory.set(key, doc["value"], ttl)
+            return doc["value"]
+
+        value, ttl = await load()
+        self._memory.set(key, value, ttl)
+        await self._write_persistent(key, value, ttl)
+        return value
+
+    async def _read_persistent(self, key: str):
+        if self.collection is None:
+            return None
+        try:
+            doc = await self.collection.find_one({"_id": key, "expires_at": {"$gt": datetime.utcnow()}})
+        except Exception as e:
+            logger.warning(f"Domain cache read failed for {key}: {e}")
+            return None
+        return doc
+
+    async def _write_persistent(self, key: str, value: Any, ttl: float):
+        if self.collection is None:
+            return
+        try:
+            await self.collection.replace_one(
+                {"_id": key},
+                {"_id": key, "value": value, "expires_at": datetime.utcnow() + timedelta(seconds=ttl)},
+                upsert=True,
+            )
+        except Exception as e:
+            logger.warning(f"Domain cache write failed for {key}: {e}")
+
+
+def _normalise(domain: str) -> str:
+    return domain.strip().lower().rstrip('.')
@@ -0,0 +1,282 @@
+import asyncio
+import csv
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Sequence
+
+from pymongo import ASCENDING, InsertOne, ReturnDocument
+from pymongo.errors import BulkWriteError
+
+# Result rows buffered before they are written to Mongo
+ROW_BATCH_SIZE = 200
+# Longest a buffered batch (and the job's progress) may wait before being flushed
+FLUSH_INTERVAL = 1.0
+# How long a job runner owns a job without renewing its lease
+LEASE_SECONDS = 60
+# Uploads are kept in Mongo, in chunks of this many bytes, so a runner on any host can fetch them
+UPLOAD_CHUNK_SIZE = 1 << 20
+
+
+class RowSchema:
+    """Column layout shared by every stored result row of one job.
+
+    Rows are kept as plain value lists in this order: the upload's columns, then
+    the result columns it doesn't already have (a result column that shares an
+    upload column's name replaces its value, like updating the row dict would).
+    Values of the `codes` columns (status, reason) are interned, so the
+    repeated ones share a single string.
+    """
+
+    __slots__ = ("columns", "input_columns", "_results", "_codes")
+
+    def __init__(self, input_columns: Sequence[str], result_columns: Sequence[str], codes: Sequence[str] = ("status", "reason")):
+        self.input_columns = list(input_columns)
+        self.columns = self.input_columns + [column for column in result_columns if column not in self.input_columns]
+        position = {}
+        for i, column in enumerate(self.columns):
+            position.setdefault(column, i)
+        self._results = [position[column] for column in result_columns]
+        self._codes = {position[column] for column in codes if column in result_columns}
+
+    def values(self, row: Dict, *results: Any) -> List[Any]:
+        """Value list for an input row (a csv.DictReader dict) and its result values, in result_columns order."""
+        values = [row.get(column) for column in self.input_columns]
+        values.extend([None] * (len(self.columns) - len(values)))
+        for position, value in zip(self._results, results):
+            values[position] = sys.intern(value) if position in self._codes and isinstance(value, str) else value
+        return values
+
+
+class JobStore:
+    """Bulk jobs and their per-row results, kept in Mongo so any worker can serve them.
+
+    The jobs collection doubles as the job runners' queue: a processing job is
+    claimed by taking a lease on it, and a job whose lease has lapsed (its runner
+    died) can be claimed again and resumed from the rows already stored.
+    """
+
+    def __init__(self, db):
+        self.jobs = db.jobs
+        self.rows = db.job_rows
+        self.uploads = db.job_uploads
+
+    async def ensure_indexes(self):
+        await self.jobs.create_index("job_id", unique=True)
+        await self.jobs.create_index("status")
+        await self.rows.create_index([("job_id", ASCENDING), ("index", ASCENDING)], unique=True)
+        await self.rows.create_index([("job_id", ASCENDING), ("status", ASCENDING)])
+        await self.rows.create_index([("job_id", ASCENDING), ("seq", ASCENDING)])
+        await self.uploads.create_index([("job_id", ASCENDING), ("n", ASCENDING)], unique=True)
+
+    async def create_job(self, job_id: str, job_type: str, filename: str, total_rows: int, log: str, params: Optional[Dict] = None) -> Dict:
+        now = datetime.utcnow()
+        job = {
+            "job_id": job_id,
+            "type": job_type,
+            "filename": filename,
+            "progress": 0,
+            "current_row": 0,
+            "total_rows": total_rows,
+            "status": "processing",
+            "log": log,
+            "params": params or {},
+            "claimed_by": None,
+            "lease_until": None,
+            "created_at": now,
+            "updated_at": now,
+        }
+        await self.jobs.insert_one(dict(job))
+        return job
+
+    async def get_job(self, job_id: str) -> Optional[Dict]:
+        return await self.jobs.find_one({"job_id": job_id}, {"_id": 0})
+
+    async def update_job(self, job_id: str, **fields: Any):
+        fields["updated_at"] = datetime.utcnow()
+        await self.jobs.update_one({"job_id": job_id}, {"$set": fields})
+
+    async def claim_job(self, worker_id: str) -> Optional[Dict]:
+        """Lease the oldest processing job nobody holds a live lease on."""
+        now = datetime.utcnow()
+        return await self.jobs.find_one_and_update(
+            {"status": "processing", "$or": [{"lease_until": None}, {"lease_until": {"$lt": now}}]},
+            {"$set": {"claimed_by": worker_id, "lease_until": now + timedelta(seconds=LEASE_SECONDS)}},
+            sort=[("created_at", ASCENDING)],
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def renew_lease(self, job_id: str, worker_id: str):
+        await self.jobs.update_one(
+            {"job_id": job_id, "claimed_by": worker_id},
+            {"$set": {"lease_until": datetime.utcnow() + timedelta(seconds=LEASE_SECONDS)}},
+        )
+
+    async def release_job(self, job_id: str, worker_id: str):
+        await self.jobs.update_one(
+            {"job_id": job_id, "claimed_by": worker_id},
+            {"$set": {"claimed_by": None, "lease_until": None}},
+        )
+
+    async def queue_depth(self) -> Dict[str, int]:
+        """Processing jobs waiting for a runner, and being run."""
+        now = datetime.utcnow()
+        waiting = await self.jobs.count_documents(
+            {"status": "processing", "$or": [{"lease_until": None}, {"lease_until": {"$lt": now}}]}
+        )
+        running = await self.jobs.count_documents({"status": "processing", "lease_until": {"$gte": now}})
+        return {"waiting": waiting, "running": running}
+
+    async def save_upload(self, job_id: str, path: Path):
+        """Store the job's upload file, replacing any earlier copy."""
+        await self.uploads.delete_many({"job_id": job_id})
+        with open(path, 'rb') as f:
+            n = 0
+            while data := await asyncio.to_thread(f.read, UPLOAD_CHUNK_SIZE):
+                await self.uploads.insert_one({"job_id": job_id, "n": n, "data": data})
+                n += 1
+
+    async def has_upload(self, job_id: str) -> bool:
+        return await self.uploads.find_one({"job_id": job_id}, {"_id": 1}) is not None
+
+    async def fetch_upload(self, job_id: str, path: Path) -> bool:
+        """Write the job's stored upload to `path`; False when none is stored."""
+        partial = path.with_name(f".{path.name}.{os.getpid()}")
+        found = False
+        with open(partial, 'wb') as f:
+            async for doc in self.uploads.find({"job_id": job_id}).sort("n", ASCENDING):
+                await asyncio.to_thread(f.write, doc["data"])
+                found = True
+        if not found:
+            partial.unlink()
+            return False
+        os.replace(partial, path)
+        return True
+
+    async def copy_upload(self, from_job_id: str, to_job_id: str) -> bool:
+        """Store a copy of one job's upload for another; False when the first has none."""
+        await self.uploads.delete_many({"job_id": to_job_id})
+        found = False
+        async for doc in self.uploads.find({"job_id": from_job_id}).sort("n", ASCENDING):
+            await self.uploads.insert_one({"job_id": to_job_id, "n": doc["n"], "data": doc["data"]})
+            found = True
+        return found
+
+    async def delete_upload(self, job_id: str):
+        await self.uploads.delete_many({"job_id": job_id})
+
+    async def add_rows(self, job_id: str, rows: List[Dict]):
+        """Insert a batch of {"index", "seq", "status", "values"} row documents."""
+        if not rows:
+            return
+        try:
+            await self.rows.bulk_write(
+                [InsertOne({"job_id": job_id, **row}) for row in rows], ordered=False
+            )
+        except BulkWriteError as e:
+            # Rows re-run after a resume may already be stored, anything else is a real failure
+            if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+                raise
+
+    async def completed_rows(self, job_id: str, total_rows: int) -> bytearray:
+        """One byte per input row, set to 1 for rows that already have a stored result."""
+        done = bytearray(total_rows)
+        async for doc in self.rows.find({"job_id": job_id}, {"_id": 0, "index": 1}):
+            if doc["index"] < total_rows:
+                done[doc["index"]] = 1
+        return done
+
+    async def rows_after(self, job_id: str, seq: int, limit: int) -> List[Dict]:
+        """Row documents completed after `seq`, in completion order."""
+        cursor = self.rows.find({"job_id": job_id, "seq": {"$gt": seq}}, {"_id": 0, "job_id": 0})
+        return await cursor.sort("seq", ASCENDING).to_list(limit)
+
+    async def columns(self, job: Dict) -> List[str]:
+        """Column names of the job's result rows."""
+        if job.get("columns"):
+            return job["columns"]
+        # Jobs stored before rows were kept as value lists have a dict per row
+        doc = await self.rows.find_one({"job_id": job["job_id"]}, {"_id": 0, "result": 1})
+        return list(doc["result"].keys()) if doc and "result" in doc else []
+
+    async def iter_results(self, job_id: str, status: Optional[str] = None) -> AsyncIterator[List[Any]]:
+        """Value lists of the job's result rows, in upload order."""
+        query: Dict[str, Any] = {"job_id": job_id}
+        if status is not None:
+            query["status"] = status
+        async for doc in self.rows.find(query, {"_id": 0, "values": 1, "result": 1}).sort("index", ASCENDING):
+            yield doc["values"] if "values" in doc else list(doc["result"].values())
+
+    async def copy_rows(self, job: Dict, to_job_id: str, keep: Callable[[List[Any]], bool]) -> int:
+        """Store the job's result rows that `keep` accepts (by value list) as completed rows of another job.
+
+        Copies are renumbered in upload order, so the rows the other job completes
+        itself continue the sequence. Returns the number of rows copied.
+        """
+        columns = await self.columns(job)
+        batch: List[Dict] = []
+        copied = 0
+        cursor = self.rows.find({"job_id": job["job_id"]}, {"_id": 0, "index": 1, "status": 1, "values": 1, "result": 1})
+        async for doc in cursor.sort("index", ASCENDING):
+            values = doc["values"] if "values" in doc else [doc["result"].get(column) for column in columns]
+            if not keep(values):
+                continue
+            copied += 1
+            batch.append({"index": doc["index"], "seq": copied, "status": doc["status"], "values": values})
+            if len(batch) >= ROW_BATCH_SIZE:
+                await self.add_rows(to_job_id, batch)
+                batch = []
+        await self.add_rows(to_job_id, batch)
+        return copied
+
+    async def write_inputs(self, job: Dict, path: Path) -> int:
+        """Rebuild a finished job's upload at `path` from the input values kept in its result rows.
+
+        Only jobs whose rows all were stored can be rebuilt; an input column that
+        a result column of the same name replaced comes back with the result value.
+        Returns the number of data rows written.
+        """
+        input_columns = job["input_columns"]
+        width = len(input_columns)
+        written = 0
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(input_columns)
+            async for values in self.iter_results(job["job_id"]):
+                writer.writerow(values[:width])
+                written += 1
+        return written
+
+
+class JobWriter:
+    """Buffers a running job's row results and progress, flushing them to the store in batches."""
+
+    def __init__(self, store: JobStore, job_id: str, batch_size: int = ROW_BATCH_SIZE, flush_interval: float = FLUSH_INTERVAL):
+        self.store = store
+        self.job_id = job_id
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._rows: List[Dict] = []
+        self._progress: Dict[str, Any] = {}
+        self._flushed_at = time.monotonic()
+        # Batches are committed one at a time, in seq order, so event streams never skip rows
+        self._flush_lock = asyncio.Lock()
+
+    async def add(self, index: int, values: List[Any], status: str, seq: int, **progress: Any):
+        """Buffer one row result (a RowSchema value list); `seq` is its position in completion order, for event streams."""
+        self._rows.append({"index": index, "seq": seq, "status": sys.intern(status), "values": values})
+        self._progress.update(progress)
+        if len(self._rows) >= self.batch_size or time.monotonic() - self._flushed_at >= self.flush_interval:
+            await self.flush()
+
+    async def flush(self):
+        async with self._flush_lock:
+            rows, self._rows = self._rows, []
+            progress, self._progress = self._progress, {}
+            self._flushed_at = time.monotonic()
+            await self.store.add_rows(self.job_id, rows)
+            if progress:
+                await self.store.update_job(self.job_id, **progress)
@@ -0,0 +1,256 @@
+"""In-process metrics with a Prometheus text exposition.
+
+Every process (API workers and job runners) keeps its own counters, gauges
+and histograms, and periodically publishes a snapshot of them to Mongo;
+/api/metrics renders the fresh snapshots of all processes, each series
+labelled with the process it came from.
+
+Stage timings are also added to the per-job StageTimings of the job the
+current task belongs to (see job_timings), which become the job's timing summary.
+"""
+import asyncio
+import bisect
+import contextvars
+import logging
+import os
+import socket
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Seconds between published snapshots, after which a silent process is left out, and after which its snapshot is deleted
+METRICS_PUBLISH_INTERVAL = 15
+METRICS_STALE_AFTER = 120
+METRICS_EXPIRE_AFTER = 3600
+
+PROCESS_ID = f"{socket.gethostname()}-{os.getpid()}"
+
+REGISTRY: List["Metric"] = []
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple[str, ...], Any] = {}
+        REGISTRY.append(self)
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(label, "")) for label in self.labels)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "kind": self.kind,
+            "help": self.help,
+            "labels": list(self.labels),
+            "values": [[list(key), value] for key, value in self._values.items()],
+        }
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels: Any):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels: Any):
+        self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels: Any):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels: Any):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    """Bucket counts (not cumulative, the last one for +Inf), sum and count per label set."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels: Any):
+        key = self._key(labels)
+        state = self._values.get(key)
+        if state is None:
+            state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        state[0][bisect.bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {**super().snapshot(), "buckets": list(self.buckets)}
+
+
+STAGE_SECONDS = Histogram(
+    "helpfinder_stage_seconds", "Time spent per verification/finding stage (stages may nest)", ("stage",)
+)
+SMTP_PROBE_SECONDS = Histogram(
+    "helpfinder_smtp_probe_seconds", "SMTP dialogue time per RCPT batch, by MX provider", ("provider",)
+)
+SMTP_RESPONSES = Counter("helpfinder_smtp_responses_total", "RCPT TO replies by code (none: no reply)", ("code",))
+SMTP_IN_FLIGHT = Gauge("helpfinder_smtp_probes_in_flight", "RCPT batches currently on an SMTP session")
+CACHE_REQUESTS = Counter("helpfinder_cache_requests_total", "Cache lookups by cache and outcome", ("cache", "result"))
+BULK_QUEUE_DEPTH = Gauge("helpfinder_bulk_queue_depth", "Bulk rows read ahead and waiting for a worker")
+BULK_ROWS_IN_FLIGHT = Gauge("helpfinder_bulk_rows_in_flight", "Bulk rows being processed")
+RETRY_QUEUE_DEPTH = Gauge("helpfinder_retry_queue_depth", "Soft-failed probes parked for a later retry")
+JOB_ROWS = Counter("helpfinder_job_rows_total", "Bulk job rows completed", ("type",))
+JOBS_FINISHED = Counter("helpfinder_jobs_finished_total", "Bulk jobs finished, by outcome", ("type", "status"))
+
+
+class StageTimings:
+    """Count, total and longest time per stage for one job."""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.stages: Dict[str, List[float]] = {}
+
+    def add(self, stage: str, seconds: float):
+        totals = self.stages.get(stage)
+        if totals is None:
+            self.stages[stage] = [1, seconds, seconds]
+        else:
+            totals[0] += 1
+            totals[1] += seconds
+            totals[2] = max(totals[2], seconds)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        return {
+            stage: {
+                "count": int(count),
+                "total_s": round(total, 3),
+                "avg_ms": round(total / count * 1000, 1),
+                "max_ms": round(longest * 1000, 1),
+            }
+            for stage, (count, total, longest) in sorted(self.stages.items(), key=lambda item: -item[1][1])
+        }
+
+
+_job_timings: contextvars.ContextVar[Optional[StageTimings]] = contextvars.ContextVar("job_timings", default=None)
+
+
+@contextmanager
+def job_timings() -> Iterator[StageTimings]:
+    """Collect the stage timings of everything run (and every task started) inside the block."""
+    timings = StageTimings()
+    token = _job_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _job_timings.reset(token)
+
+
+@contextmanager
+def timed(stage: str) -> Iterator[None]:
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        timings = _job_timings.get()
+        if timings is not None:
+            timings.add(stage, elapsed)
+
+
+def snapshot() -> Dict[str, Any]:
+    return {metric.name: metric.snapshot() for metric in REGISTRY}
+
+
+async def ensure_indexes(collection):
+    try:
+        await collection.create_index("updated_at", expireAfterSeconds=METRICS_EXPIRE_AFTER)
+    except Exception as e:
+        logger.warning(f"Could not create metrics index: {e}")
+
+
+async def publish(collection):
+    try:
+        await collection.replace_one(
+            {"_id": PROCESS_ID},
+            {"_id": PROCESS_ID, "metrics": snapshot(), "updated_at": datetime.utcnow()},
+            upsert=True,
+        )
+    except Exception as e:
+        logger.warning(f"Publishing metrics failed: {e}")
+
+
+async def publish_loop(collection, interval: float = METRICS_PUBLISH_INTERVAL):
+    while True:
+        await publish(collection)
+        await asyncio.sleep(interval)
+
+
+async def collect(collection) -> List[Tuple[str, Dict[str, Any]]]:
+    """(process, snapshot) for this process and every other one that published recently."""
+    snapshots = {PROCESS_ID: snapshot()}
+    try:
+        since = datetime.utcnow() - timedelta(seconds=METRICS_STALE_AFTER)
+        async for doc in collection.find({"updated_at": {"$gt": since}}):
+            snapshots.setdefault(doc["_id"], doc["metrics"])
+    except Exception as e:
+        logger.warning(f"Reading published metrics failed: {e}")
+    return sorted(snapshots.items())
+
+
+def _labels(names: Sequence[str], values: Sequence[str]) -> str:
+    def escape(value: str) -> str:
+        return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+    return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+def render_gauge(name: str, help: str, label: str, values: Dict[str, float]) -> List[str]:
+    """Lines for a gauge that describes shared state rather than one process."""
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} gauge"]
+    lines.extend(f"{name}{_labels([label], [key])} {value}" for key, value in values.items())
+    return lines
+
+
+def render(snapshots: List[Tuple[str, Dict[str, Any]]], extra: Sequence[str] = ()) -> str:
+    """Prometheus text format for the snapshots, every series labelled with its process."""
+    lines: List[str] = []
+    names = sorted({name for _, metrics in snapshots for name in metrics})
+    for name in names:
+        header = False
+        for process, metrics in snapshots:
+            metric = metrics.get(name)
+            if metric is None:
+                continue
+            if not header:
+                lines.append(f"# HELP {name} {metric['help']}")
+                lines.append(f"# TYPE {name} {metric['kind']}")
+                header = True
+            label_names = ["process", *metric["labels"]]
+            for key, value in metric["values"]:
+                label_values = [process, *key]
+                if metric["kind"] != "histogram":
+                    lines.append(f"{name}{_labels(label_names, label_values)} {value}")
+                    continue
+                counts, total, count = value
+                cumulative = 0
+                for bound, bucket_count in zip([*metric["buckets"], "+Inf"], counts):
+                    cumulative += bucket_count
+                    lines.append(f"{name}_bucket{_labels([*label_names, 'le'], [*label_values, str(bound)])} {cumulative}")
+                lines.append(f"{name}_sum{_labels(label_names, label_values)} {total}")
+                lines.append(f"{name}_count{_labels(label_names, label_values)} {count}")
+    lines.extend(extra)
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,185 @@
+import logging
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from pymongo.errors import DuplicateKeyError
+
+from domain_cache import TTLCache
+from metrics import CACHE_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+# Local-part formats, by name. The first seven are the ones probed at domains nothing
+# is known about; the rest are only tried where confirmed addresses used them.
+PATTERNS: Dict[str, Callable[[str, str], str]] = {
+    "first.last": lambda first, last: f"{first}.{last}",
+    "first": lambda first, last: first,
+    "firstlast": lambda first, last: f"{first}{last}",
+    "f.last": lambda first, last: f"{first[0]}.{last}",
+    "first.l": lambda first, last: f"{first}.{last[0]}",
+    "flast": lambda first, last: f"{first[0]}{last}",
+    "firstl": lambda first, last: f"{first}{last[0]}",
+    "last.first": lambda first, last: f"{last}.{first}",
+    "lastfirst": lambda first, last: f"{last}{first}",
+    "last": lambda first, last: last,
+    "lastf": lambda first, last: f"{last}{first[0]}",
+    "first_last": lambda first, last: f"{first}_{last}",
+    "first-last": lambda first, last: f"{first}-{last}",
+}
+
+# How common each format is before anything has been learned; keeps the original probe order
+DEFAULT_PRIORS = {
+    "first.last": 0.35,
+    "first": 0.2,
+    "firstlast": 0.15,
+    "f.last": 0.1,
+    "first.l": 0.08,
+    "flast": 0.07,
+    "firstl": 0.05,
+}
+
+# Weight (in confirmed addresses) of the default priors against the global counts,
+# and of the global distribution against a domain's own counts
+GLOBAL_PRIOR_WEIGHT = 50
+DOMAIN_PRIOR_WEIGHT = 2
+# Once a domain has this many confirmed addresses, formats below MIN_PATTERN_PROB are skipped
+MIN_EVIDENCE = 3
+MIN_PATTERN_PROB = 0.05
+
+MODEL_CACHE_TTL = 600
+MODEL_CACHE_SIZE = 50000
+# Confirmed addresses remembered per domain so re-finding one person isn't counted twice
+MAX_SEEN_EMAILS = 200
+
+GLOBAL_KEY = "*"
+
+
+def _field(pattern: str) -> str:
+    # Pattern names contain dots, which Mongo would read as nested fields
+    return pattern.replace('.', ':')
+
+
+def _pattern(field: str) -> str:
+    return field.replace(':', '.')
+
+
+def render(pattern: str, firstname: str, lastname: str, domain: str) -> str:
+    return f"{PATTERNS[pattern](firstname, lastname)}@{domain}"
+
+
+def pattern_of(email: str, firstname: str, lastname: str) -> Optional[str]:
+    """Name of the format the address's local part follows for this person, if any."""
+    first, last = firstname.lower().strip(), lastname.lower().strip()
+    if not (first and last):
+        return None
+    local = email.lower().split('@')[0]
+    for name, format_local in PATTERNS.items():
+        if format_local(first, last) == local:
+            return name
+    return None
+
+
+class PatternModel:
+    """Per-domain counts of the formats confirmed valid addresses follow, kept in Mongo.
+
+    Candidates for a lookup are ranked by the domain's counts smoothed towards the
+    global distribution (itself smoothed towards DEFAULT_PRIORS), so a domain known
+    to use `flast@` probes that first. Formats outside DEFAULT_PRIORS are only
+    candidates once they are common overall or seen at the domain, and improbable
+    formats are dropped once the domain has enough evidence.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+        self._counts = TTLCache(MODEL_CACHE_SIZE)
+
+    async def _get_counts(self, key: str) -> Dict[str, int]:
+        counts = self._counts.get(key, None)
+        CACHE_REQUESTS.inc(cache="pattern_model", result="miss" if counts is None else "hit")
+        if counts is None:
+            try:
+                doc = await self.collection.find_one({"_id": key}, {"counts": 1})
+            except Exception as e:
+                logger.warning(f"Pattern model read failed for {key}: {e}")
+                doc = None
+            counts = {_pattern(field): count for field, count in doc.get("counts", {}).items()} if doc else {}
+            self._counts.set(key, counts, MODEL_CACHE_TTL)
+        return counts
+
+    async def probabilities(self, domain: str) -> Dict[str, float]:
+        global_counts = await self._get_counts(GLOBAL_KEY)
+        domain_counts = await self._get_counts(domain.lower())
+        global_total = sum(global_counts.values())
+        domain_total = sum(domain_counts.values())
+
+        probabilities = {}
+        for name in PATTERNS:
+            prior = (global_counts.get(name, 0) + GLOBAL_PRIOR_WEIGHT * DEFAULT_PRIORS.get(name, 0)) / (
+                global_total + GLOBAL_PRIOR_WEIGHT
+            )
+            # A rare format is only tried where the domain itself has used it
+            if name not in DEFAULT_PRIORS and prior < MIN_PATTERN_PROB and not domain_counts.get(name):
+                continue
+            probabilities[name] = (domain_counts.get(name, 0) + DOMAIN_PRIOR_WEIGHT * prior) / (
+                domain_total + DOMAIN_PRIOR_WEIGHT
+            )
+        if domain_total >= MIN_EVIDENCE:
+            probabilities = {name: p for name, p in probabilities.items() if p >= MIN_PATTERN_PROB}
+        return {name: p for name, p in probabilities.items() if p > 0}
+
+    async def ranked(self, firstname: str, lastname: str, domain: str) -> List[Tuple[str, float]]:
+        """(address, probability) candidates for the person, most probable first.
+
+        Probabilities are normalised over the candidates returned; formats that
+        produce the same address (e.g. for one-letter names) are merged.
+        """
+        first, last, domain = firstname.lower().strip(), lastname.lower().strip(), domain.strip()
+        if not (first and last and domain):
+            return []
+        merged: Dict[str, float] = {}
+        for name, p in (await self.probabilities(domain)).items():
+            email = render(name, first, last, domain)
+            merged[email] = merged.get(email, 0) + p
+        total = sum(merged.values())
+        return sorted(((email, p / total) for email, p in merged.items()), key=lambda item: -item[1])
+
+    async def candidates(self, firstname: str, lastname: str, domain: str) -> List[str]:
+        """Candidate addresses for the person, most probable format first."""
+        return [email for email, _ in await self.ranked(firstname, lastname, domain)]
+
+    async def record(self, email: str, firstname: str, lastname: str):
+        """Count a confirmed valid address towards its domain's format, once per address."""
+        pattern = pattern_of(email, firstname, lastname)
+        if pattern is None:
+            return
+        domain = email.split('@')[1].lower()
+        email = email.lower()
+        try:
+            await self.collection.update_one(
+                {"_id": domain, "emails": {"$ne": email}},
+                {
+                    "$inc": {f"counts.{_field(pattern)}": 1},
+                    "$push": {"emails": {"$each": [email], "$slice": -MAX_SEEN_EMAILS}},
+                    "$set": {"updated_at": datetime.utcnow()},
+                },
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            # The domain document exists and already lists this address
+            return
+        except Exception as e:
+            logger.warning(f"Pattern model write failed for {domain}: {e}")
+            return
+        try:
+            await self.collection.update_one(
+                {"_id": GLOBAL_KEY},
+                {"$inc": {f"counts.{_field(pattern)}": 1}, "$set": {"updated_at": datetime.utcnow()}},
+                upsert=True,
+            )
+        except Exception as e:
+            logger.warning(f"Pattern model write failed for global counts: {e}")
+
+        for key in (domain, GLOBAL_KEY):
+            counts = self._counts.get(key, None)
+            if counts is not None:
+                counts[pattern] = counts.get(pattern, 0) + 1
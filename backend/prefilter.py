@@ -0,0 +1,101 @@
+import logging
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Container, Dict, Optional, Pattern, Set
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# What the pre-pass decided for each data row
+PROBE = 0
+EMPTY = 1
+BAD_SYNTAX = 2
+DISPOSABLE = 3
+ROLE_BASED = 4
+DUPLICATE = 5
+
+VERDICTS = {
+    EMPTY: ("invalid", "empty_email"),
+    BAD_SYNTAX: ("invalid", "bad_syntax"),
+    DISPOSABLE: ("invalid", "disposable_domain"),
+    ROLE_BASED: ("invalid", "role_based"),
+}
+
+
+@dataclass
+class Prefilter:
+    """Per-row outcome of the columnar pre-pass over a bulk verification upload."""
+
+    kinds: np.ndarray  # one of PROBE, EMPTY, ... per data row
+    first_of: np.ndarray  # for DUPLICATE rows, the index of the address's first row, else -1
+    domains: Set[str] = field(default_factory=set)  # domains of the rows left to probe
+
+    def counts(self) -> Dict[int, int]:
+        kinds, counts = np.unique(self.kinds, return_counts=True)
+        return dict(zip(kinds.tolist(), counts.tolist()))
+
+
+def _members(values: pd.Series, container: Container[str]) -> np.ndarray:
+    """Boolean mask of which values are in `container`, testing each distinct value once."""
+    codes, uniques = pd.factorize(values.fillna('').to_numpy())
+    found = np.fromiter((value in container for value in uniques), dtype=bool, count=len(uniques))
+    return found[codes]
+
+
+def prefilter_emails(
+    path: Path, email_field: str, email_pattern: Pattern, disposable_domains: Container[str], role_prefixes: Container[str]
+) -> Optional[Prefilter]:
+    """Classify every address of an upload at once, without any network work.
+
+    Addresses are normalised (stripped, lower-cased) and checked in the same order
+    as the per-address precheck: empty, syntax, disposable domain, role prefix.
+    Repeats of an address that is still to be probed are marked DUPLICATE of
+    its first row. Returns None when the file can't be read column-wise, in which
+    case callers fall back to checking rows one by one.
+    """
+    try:
+        column = pd.read_csv(
+            path, usecols=[email_field], dtype=str, keep_default_na=False, na_filter=False, encoding='utf-8'
+        )[email_field]
+    except (ValueError, pd.errors.ParserError, UnicodeDecodeError) as e:
+        logger.warning(f"Columnar pre-filter skipped for {path.name}: {e}")
+        return None
+
+    # Repeated cells are classified once: work on the distinct raw values, then spread back
+    raw_codes, raw_values = pd.factorize(column.to_numpy())
+    emails = pd.Series(raw_values, dtype=str).str.strip()
+    normalised = emails.str.lower()
+    parts = normalised.str.split('@')
+    local, domain = parts.str[0], parts.str[1]
+
+    empty = (emails == '').to_numpy()
+    bad = ~emails.str.match(email_pattern.pattern).to_numpy(dtype=bool) & ~empty
+    settled = empty | bad
+    disposable = _members(domain, disposable_domains) & ~settled
+    settled |= disposable
+    role = _members(local, role_prefixes) & ~settled
+
+    value_kinds = np.full(len(emails), PROBE, dtype=np.int8)
+    value_kinds[empty] = EMPTY
+    value_kinds[bad] = BAD_SYNTAX
+    value_kinds[disposable] = DISPOSABLE
+    value_kinds[role] = ROLE_BASED
+    kinds = value_kinds[raw_codes]
+
+    # Collapse repeated addresses (after normalisation) onto their first row
+    value_addresses, addresses = pd.factorize(normalised.to_numpy())
+    first_of = np.full(len(kinds), -1, dtype=np.int64)
+    positions = np.flatnonzero(kinds == PROBE)
+    codes = value_addresses[raw_codes[positions]]
+    first = np.empty(len(addresses), dtype=np.int64)
+    # Reversed so that, for repeated codes, the earliest position is written last
+    first[codes[::-1]] = positions[::-1]
+    firsts = first[codes]
+    repeats = positions[firsts != positions]
+    kinds[repeats] = DUPLICATE
+    first_of[repeats] = firsts[firsts != positions]
+
+    probed = np.unique(raw_codes[kinds == PROBE])
+    return Prefilter(kinds, first_of, set(domain.to_numpy()[probed].tolist()))
@@ -0,0 +1,249 @@
+import asyncio
+import ipaddress
+import logging
+import random
+import struct
+import time
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import unquote, urlsplit
+
+logger = logging.getLogger(__name__)
+
+# Schemes accepted in the proxy list; SMTP can only be tunnelled through SOCKS5
+PROXY_SCHEMES = {"http", "https", "socks5", "socks5h"}
+SOCKS_SCHEMES = {"socks5", "socks5h"}
+
+PROXY_CONNECT_TIMEOUT = 10
+# Seconds between re-reading the shared proxy list, so every process picks up changes
+PROXY_REFRESH_INTERVAL = 60
+# Consecutive failures that open a proxy's circuit, and how long it then stays out of rotation
+CIRCUIT_FAILURES = 3
+CIRCUIT_COOLDOWN = 60
+MAX_CIRCUIT_COOLDOWN = 900
+# How long a half-open proxy's trial use can go unrecorded before another pick may trial it
+CIRCUIT_TRIAL_TIMEOUT = 30
+# Weight of the newest sample in a proxy's latency average
+LATENCY_SMOOTHING = 0.2
+
+# SOCKS5 CONNECT replies that mean the target, not the proxy, was unreachable
+_SOCKS_TARGET_ERRORS = {3: "network unreachable", 4: "host unreachable", 5: "connection refused", 6: "TTL expired"}
+
+
+class ProxyError(OSError):
+    """The proxy itself failed (unreachable, refused auth, bad handshake)."""
+
+
+class Proxy:
+    """One egress proxy and its health: smoothed latency, error counts and circuit state."""
+
+    def __init__(self, url: str):
+        parts = urlsplit(url)
+        if parts.scheme not in PROXY_SCHEMES or not parts.hostname or not parts.port:
+            raise ValueError(f"invalid proxy {url!r}, expected scheme://[user:pass@]host:port")
+        self.url = url
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port
+        self.username = unquote(parts.username) if parts.username else None
+        self.password = unquote(parts.password) if parts.password else None
+        self.latency: Optional[float] = None
+        self.successes = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.trial_until = 0.0
+        self.cooldown = CIRCUIT_COOLDOWN
+
+    @property
+    def socks(self) -> bool:
+        return self.scheme in SOCKS_SCHEMES
+
+    @property
+    def half_open(self) -> bool:
+        return self.consecutive_failures >= CIRCUIT_FAILURES and self.open_until <= time.monotonic()
+
+    @property
+    def available(self) -> bool:
+        # Once the cooldown has passed the proxy is half-open: one trial use decides its state
+        now = time.monotonic()
+        return self.open_until <= now and self.trial_until <= now
+
+    def take(self) -> "Proxy":
+        """Mark the proxy as picked; a half-open one is out of rotation until its trial is recorded."""
+        if self.half_open:
+            self.trial_until = time.monotonic() + CIRCUIT_TRIAL_TIMEOUT
+        return self
+
+    def score(self, default_latency: float) -> float:
+        """Lower is better: smoothed latency, inflated by the share of failed uses."""
+        total = self.successes + self.failures
+        error_rate = self.failures / total if total else 0.0
+        latency = self.latency if self.latency is not None else default_latency
+        return max(latency, 0.001) * (1 + 4 * error_rate)
+
+    def record(self, ok: bool, latency: Optional[float] = None):
+        self.trial_until = 0.0
+        if ok:
+            self.successes += 1
+            self.consecutive_failures = 0
+            self.cooldown = CIRCUIT_COOLDOWN
+            if latency is not None:
+                self.latency = latency if self.latency is None else (
+                    LATENCY_SMOOTHING * latency + (1 - LATENCY_SMOOTHING) * self.latency
+                )
+            return
+        self.failures += 1
+        self.consecutive_failures += 1
+        if self.consecutive_failures >= CIRCUIT_FAILURES:
+            self.open_until = time.monotonic() + self.cooldown
+            self.cooldown = min(self.cooldown * 2, MAX_CIRCUIT_COOLDOWN)
+
+    @property
+    def display_url(self) -> str:
+        auth = f"{self.username}:***@" if self.username else ""
+        return f"{self.scheme}://{auth}{self.host}:{self.port}"
+
+    def stats(self) -> Dict:
+        if self.half_open:
+            state = "half_open"
+        else:
+            state = "closed" if self.available else "open"
+        return {
+            "proxy": self.display_url,
+            "state": state,
+            "latency_ms": round(self.latency * 1000) if self.latency is not None else None,
+            "successes": self.successes,
+            "failures": self.failures,
+        }
+
+
+class ProxyPool:
+    """Rotates outbound SMTP and HTTP traffic across the configured proxies.
+
+    Picks are random, weighted by the inverse of each proxy's score, so load keeps
+    spreading over every egress IP while slow or failing proxies get less of it.
+    A proxy that fails CIRCUIT_FAILURES times in a row is taken out of rotation
+    for a cooldown that doubles each time it fails again.
+    """
+
+    def __init__(self):
+        self.proxies: List[Proxy] = []
+        self._refreshed_at: Optional[float] = None
+
+    def load(self, urls: List[str]):
+        """Replace the proxy list, keeping the health of proxies that stay in it."""
+        current = {proxy.url: proxy for proxy in self.proxies}
+        proxies = [current.get(url) or Proxy(url) for url in dict.fromkeys(urls)]
+        self.proxies = proxies
+
+    async def refresh(self, collection, max_age: float = PROXY_REFRESH_INTERVAL):
+        """Reload the proxy list stored by `save` if our copy is older than `max_age` seconds."""
+        now = time.monotonic()
+        if self._refreshed_at is not None and now - self._refreshed_at < max_age:
+            return
+        self._refreshed_at = now
+        try:
+            doc = await collection.find_one({"_id": "proxies"})
+            self.load(doc["proxies"] if doc else [])
+        except Exception as e:
+            logger.warning(f"Could not load proxy list: {e}")
+
+    async def save(self, collection, urls: List[str]):
+        """Validate, store and load a new proxy list; raises ValueError for malformed entries."""
+        for url in urls:
+            Proxy(url)
+        await collection.replace_one({"_id": "proxies"}, {"_id": "proxies", "proxies": urls}, upsert=True)
+        self.load(urls)
+        self._refreshed_at = time.monotonic()
+
+    def resolve(self, url: str) -> Proxy:
+        """The pooled proxy for `url`, or an untracked one for proxies outside the pool."""
+        for proxy in self.proxies:
+            if proxy.url == url:
+                return proxy
+        return Proxy(url)
+
+    def pick(self, socks_only: bool = False) -> Optional[Proxy]:
+        candidates = [proxy for proxy in self.proxies if proxy.socks or not socks_only]
+        if not candidates:
+            return None
+        available = [proxy for proxy in candidates if proxy.available]
+        if not available:
+            # Everything is broken, trial the proxy whose circuit reopens first
+            return min(candidates, key=lambda proxy: max(proxy.open_until, proxy.trial_until)).take()
+        # Proxies without a latency sample yet are assumed to be average
+        measured = [proxy.latency for proxy in available if proxy.latency is not None]
+        default_latency = sum(measured) / len(measured) if measured else 1.0
+        weights = [1 / proxy.score(default_latency) for proxy in available]
+        return random.choices(available, weights)[0].take()
+
+    def stats(self) -> List[Dict]:
+        return [proxy.stats() for proxy in self.proxies]
+
+
+async def open_socks_connection(
+    proxy: Proxy, host: str, port: int, timeout: float = PROXY_CONNECT_TIMEOUT
+) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+    """Open a TCP stream to host:port tunnelled through a SOCKS5 proxy."""
+    if not proxy.socks:
+        raise ProxyError(f"{proxy.display_url} is not a SOCKS5 proxy")
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(proxy.host, proxy.port), timeout)
+    except (OSError, asyncio.TimeoutError) as e:
+        raise ProxyError(f"cannot reach proxy {proxy.display_url}: {e}") from e
+    try:
+        await asyncio.wait_for(_socks5_handshake(reader, writer, proxy), timeout)
+        await asyncio.wait_for(_socks5_connect(reader, writer, host, port), timeout)
+    except asyncio.IncompleteReadError as e:
+        writer.close()
+        raise ProxyError(f"proxy {proxy.display_url} closed the connection") from e
+    except BaseException:
+        writer.close()
+        raise
+    return reader, writer
+
+
+async def _socks5_handshake(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, proxy: Proxy):
+    methods = b"\x00\x02" if proxy.username else b"\x00"
+    writer.write(b"\x05" + bytes([len(methods)]) + methods)
+    await writer.drain()
+    version, method = await reader.readexactly(2)
+    if version != 5:
+        raise ProxyError(f"{proxy.display_url} is not speaking SOCKS5")
+    if method == 0x02:
+        user = (proxy.username or "").encode()
+        password = (proxy.password or "").encode()
+        writer.write(b"\x01" + bytes([len(user)]) + user + bytes([len(password)]) + password)
+        await writer.drain()
+        _, status = await reader.readexactly(2)
+        if status != 0:
+            raise ProxyError(f"{proxy.display_url} rejected the credentials")
+    elif method != 0x00:
+        raise ProxyError(f"{proxy.display_url} offers no usable authentication method")
+
+
+async def _socks5_connect(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, host: str, port: int):
+    try:
+        address = b"\x01" + ipaddress.IPv4Address(host).packed
+    except ValueError:
+        name = host.rstrip('.').encode('idna')
+        address = b"\x03" + bytes([len(name)]) + name
+    writer.write(b"\x05\x01\x00" + address + struct.pack("!H", port))
+    await writer.drain()
+
+    _, reply, _, address_type = await reader.readexactly(4)
+    if reply in _SOCKS_TARGET_ERRORS:
+        raise ConnectionError(f"{host}:{port} via proxy: {_SOCKS_TARGET_ERRORS[reply]}")
+    if reply != 0:
+        raise ProxyError(f"proxy refused CONNECT to {host}:{port} (reply {reply})")
+    # Skip the bound address the proxy reports back
+    if address_type == 1:
+        await reader.readexactly(4 + 2)
+    elif address_type == 4:
+        await reader.readexactly(16 + 2)
+    else:
+        length = (await reader.readexactly(1))[0]
+        await reader.readexactly(length + 2)
+
+
+proxy_pool = ProxyPool()
@@ -0,0 +1,112 @@
+import asyncio
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+
+from metrics import RETRY_QUEUE_DEPTH
+
+# Backoff for soft-failed (greylisted) probes, per parked item and per throttling MX provider
+RETRY_BASE_DELAY = float(os.environ.get('RETRY_BASE_DELAY', 5))
+RETRY_MAX_DELAY = float(os.environ.get('RETRY_MAX_DELAY', 300))
+RETRY_MAX_ATTEMPTS = int(os.environ.get('RETRY_MAX_ATTEMPTS', 4))
+# Retries of one queue in flight at once
+RETRY_CONCURRENCY = int(os.environ.get('RETRY_CONCURRENCY', 10))
+
+
+def backoff(attempt: int) -> float:
+    return min(RETRY_BASE_DELAY * 2 ** (attempt - 1), RETRY_MAX_DELAY)
+
+
+class RetryQueue:
+    """Parks soft-failed probes and retries them later, off the workers' critical path.
+
+    Each item waits RETRY_BASE_DELAY before its first retry, doubling with every
+    retry that soft-fails again (greylisting is per address, so an item's own
+    history is what counts). Items still soft-failing after `max_attempts`
+    retries are handed to `on_done` as they are.
+
+    Items can be deferred under a key (their MX provider). Results for which
+    `is_throttled` is true (421/452: the host is limiting the sender, not the
+    address) pause every retry under that key, doubling the pause each time the
+    provider throttles again and resetting it once a retry gets through.
+    """
+
+    def __init__(
+        self,
+        retry: Callable[[Any], Awaitable[Any]],
+        is_soft_fail: Callable[[Any], bool],
+        on_done: Callable[[Any, Any], Awaitable[None]],
+        max_attempts: int = RETRY_MAX_ATTEMPTS,
+        is_throttled: Optional[Callable[[Any], bool]] = None,
+        concurrency: int = RETRY_CONCURRENCY,
+    ):
+        self.retry = retry
+        self.is_soft_fail = is_soft_fail
+        self.on_done = on_done
+        self.max_attempts = max_attempts
+        self.is_throttled = is_throttled or (lambda result: False)
+        self._slots = asyncio.Semaphore(concurrency)
+        self._tasks: Set[asyncio.Task] = set()
+        self._strikes: Dict[str, int] = {}
+        self._paused_until: Dict[str, float] = {}
+
+    def __len__(self):
+        return len(self._tasks)
+
+    def defer(self, item: Any, attempt: int = 1, key: Optional[str] = None) -> float:
+        """Schedule retry number `attempt` of `item`; returns the delay in seconds."""
+        delay = max(backoff(attempt), self.paused_for(key))
+        task = asyncio.create_task(self._run(item, attempt, key, delay))
+        self._tasks.add(task)
+        RETRY_QUEUE_DEPTH.inc()
+        task.add_done_callback(self._done)
+        return delay
+
+    def throttle(self, key: str) -> float:
+        """Pause retries under `key`; returns the remaining pause in seconds.
+
+        Throttles reported while a pause is running (a burst of 421s from one
+        provider) don't lengthen it.
+        """
+        paused = self.paused_for(key)
+        if paused:
+            return paused
+        strikes = self._strikes.get(key, 0) + 1
+        self._strikes[key] = strikes
+        self._paused_until[key] = time.monotonic() + backoff(strikes)
+        return backoff(strikes)
+
+    def paused_for(self, key: Optional[str]) -> float:
+        if key is None:
+            return 0
+        return max(self._paused_until.get(key, 0) - time.monotonic(), 0)
+
+    def _done(self, task: asyncio.Task):
+        self._tasks.discard(task)
+        RETRY_QUEUE_DEPTH.dec()
+
+    async def _run(self, item: Any, attempt: int, key: Optional[str], delay: float):
+        await asyncio.sleep(delay)
+        # The provider may have throttled another item's retry in the meantime
+        while paused := self.paused_for(key):
+            await asyncio.sleep(paused)
+        async with self._slots:
+            result = await self.retry(item)
+        if key is not None:
+            if self.is_throttled(result):
+                self.throttle(key)
+            elif not self.is_soft_fail(result):
+                self._strikes.pop(key, None)
+        if self.is_soft_fail(result) and attempt < self.max_attempts:
+            self.defer(item, attempt + 1, key)
+            return
+        await self.on_done(item, result)
+
+    async def drain(self):
+        """Wait until every parked item has been resolved."""
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks))
+
+    def cancel(self):
+        for task in self._tasks:
+            task.cancel()
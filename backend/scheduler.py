@@ -0,0 +1,94 @@
+import asyncio
+import itertools
+import os
+from typing import Any, Awaitable, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from metrics import BULK_QUEUE_DEPTH, BULK_ROWS_IN_FLIGHT
+
+# Rows processed at once by a bulk job
+BULK_CONCURRENCY = int(os.environ.get('BULK_CONCURRENCY', 50))
+
+# Rows read ahead from the input stream and regrouped by domain at a time
+INTERLEAVE_WINDOW = 5000
+
+
+def interleave_by_domain(
+    rows: Iterable[Tuple[int, Dict]], domain_of: Callable[[Dict], Optional[str]], window: int = INTERLEAVE_WINDOW
+) -> Iterator[Tuple[int, Dict]]:
+    """Group (index, row) pairs by domain and yield the groups round-robin.
+
+    Rows of one domain share the cached MX/catch-all lookups, and interleaving the
+    groups keeps the workers spread over many MX hosts instead of queueing on the
+    rate limit of a single one. Rows are consumed `window` at a time so arbitrarily
+    large inputs can be streamed through.
+    """
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, window))
+        if not chunk:
+            return
+
+        groups: Dict[Optional[str], List[Tuple[int, Dict]]] = {}
+        for index, row in chunk:
+            groups.setdefault(domain_of(row), []).append((index, row))
+
+        queues = [iter(group) for group in groups.values()]
+        while queues:
+            remaining = []
+            for queue in queues:
+                item = next(queue, None)
+                if item is not None:
+                    yield item
+                    remaining.append(queue)
+            queues = remaining
+
+
+async def run_bulk(
+    rows: Iterable[Tuple[int, Dict]],
+    domain_of: Callable[[Dict], Optional[str]],
+    handle: Callable[[Dict], Awaitable[Any]],
+    on_result: Callable[[int, Dict, Any], Awaitable[None]],
+    concurrency: int = BULK_CONCURRENCY,
+):
+    """Run `handle` over every (index, row) pair with at most `concurrency` rows in flight.
+
+    `on_result(index, row, result)` is awaited as each row finishes, in completion
+    order. The first exception raised by
+    `handle` cancels the remaining work and is re-raised.
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+    queued = 0
+
+    async def produce():
+        nonlocal queued
+        for item in interleave_by_domain(rows, domain_of):
+            await queue.put(item)
+            queued += 1
+            BULK_QUEUE_DEPTH.inc()
+        for _ in range(concurrency):
+            await queue.put(None)
+
+    async def work():
+        nonlocal queued
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            queued -= 1
+            BULK_QUEUE_DEPTH.dec()
+            index, row = item
+            BULK_ROWS_IN_FLIGHT.inc()
+            try:
+                result = await handle(row)
+            finally:
+                BULK_ROWS_IN_FLIGHT.dec()
+            await on_result(index, row, result)
+
+    tasks = [asyncio.create_task(produce())] + [asyncio.create_task(work()) for _ in range(concurrency)]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        # Rows left in the queue when the run was cut short
+        BULK_QUEUE_DEPTH.dec(queued)
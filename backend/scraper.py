@@ -0,0 +1,135 @@
+import asyncio
+import logging
+import re
+import threading
+import time
+from typing import Dict, List, Optional
+from urllib.parse import quote_plus
+
+import requests
+from bs4 import BeautifulSoup
+from lxml import etree, html as lxml_html
+from requests.adapters import HTTPAdapter
+
+from domain_cache import TTLCache
+from metrics import CACHE_REQUESTS, timed
+from proxy_pool import proxy_pool
+
+logger = logging.getLogger(__name__)
+
+SEARCH_URL = "https://www.google.com/search?q={query}"
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+SCRAPE_TIMEOUT = 10
+# Keep-alive connections kept per egress (direct or one proxy)
+HTTP_POOL_SIZE = 10
+
+# Seconds a scraped search page, and the addresses seen for a domain, are reused
+SEARCH_CACHE_TTL = 6 * 3600
+DOMAIN_EMAILS_TTL = 24 * 3600
+SEARCH_CACHE_SIZE = 20000
+
+EMAIL_PATTERN = re.compile(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b')
+
+
+class Scraper:
+    """Search-engine fallback for the email finder.
+
+    Requests reuse keep-alive sessions (one per egress proxy), and every page
+    is reduced to the addresses it mentions: those are cached per (name, domain)
+    query, and the ones at the searched domain are also remembered per domain,
+    so a colleague whose address already showed up needs no search of their own.
+    """
+
+    def __init__(self):
+        self._sessions: Dict[Optional[str], requests.Session] = {}
+        self._sessions_lock = threading.Lock()
+        self._searches = TTLCache(SEARCH_CACHE_SIZE)
+        self._domain_emails = TTLCache(SEARCH_CACHE_SIZE)
+
+    def _session(self, proxy_url: Optional[str]) -> requests.Session:
+        # Sessions are used from worker threads, create each one only once
+        with self._sessions_lock:
+            session = self._sessions.get(proxy_url)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                session.headers["User-Agent"] = USER_AGENT
+                if proxy_url:
+                    session.proxies = {"http": proxy_url, "https": proxy_url}
+                self._sessions[proxy_url] = session
+            return session
+
+    async def find_candidates(self, firstname: str, lastname: str, domain: str, proxy: Optional[str] = None) -> List[str]:
+        """Addresses at `domain` that mention the person's first or last name, in page order."""
+        first, last, domain = firstname.strip().lower(), lastname.strip().lower(), domain.strip().lower()
+
+        def belongs(email: str) -> bool:
+            email = email.lower()
+            return domain in email and (first in email or last in email)
+
+        def colleague_match(email: str) -> bool:
+            # Addresses from other people's searches must name this person unambiguously
+            if not (first and last):
+                return False
+            local = email.lower().split('@')[0]
+            initials = {f"{first[0]}{last}", f"{first[0]}.{last}", f"{last}{first[0]}", f"{last}.{first[0]}"}
+            return (first in local and last in local) or local in initials
+
+        key = f"{first}|{last}|{domain}"
+        emails = self._searches.get(key, None)
+        known = self._domain_emails.get(domain, ())
+        CACHE_REQUESTS.inc(cache="search", result="miss" if emails is None else "hit")
+        if emails is None:
+            matches = [email for email in known if colleague_match(email)]
+            CACHE_REQUESTS.inc(cache="domain_emails", result="hit" if matches else "miss")
+            if matches:
+                return matches
+            emails = await self._search(f'"{firstname} {lastname}" "{domain}" email', proxy)
+            if emails is None:
+                return []
+            self._searches.set(key, emails, SEARCH_CACHE_TTL)
+            at_domain = [email for email in emails if email.lower().endswith(f"@{domain}")]
+            if at_domain:
+                merged = list(dict.fromkeys([*known, *at_domain]))
+                self._domain_emails.set(domain, merged, DOMAIN_EMAILS_TTL)
+        return [email for email in emails if belongs(email)]
+
+    async def _search(self, query: str, proxy: Optional[str]) -> Optional[List[str]]:
+        """Every address on the search results page, None when no page came back; raises on network errors."""
+        # An explicit proxy wins, otherwise rotate through the pool
+        egress = proxy_pool.resolve(proxy) if proxy else proxy_pool.pick()
+        session = self._session(egress.url if egress else None)
+        url = SEARCH_URL.format(query=quote_plus(query))
+
+        started = time.monotonic()
+        try:
+            with timed("scrape_http"):
+                response = await asyncio.to_thread(session.get, url, timeout=SCRAPE_TIMEOUT)
+        except Exception:
+            if egress:
+                egress.record(False)
+            raise
+        if egress:
+            # Rate limiting and captcha pages mean the egress IP is being blocked
+            egress.record(response.status_code not in (403, 429, 503), time.monotonic() - started)
+
+        if response.status_code != 200:
+            return None
+        with timed("scrape_parse"):
+            return await asyncio.to_thread(extract_emails, response.content)
+
+
+def extract_emails(page: bytes) -> List[str]:
+    """Distinct addresses in the page's text, in order of appearance."""
+    try:
+        tree = lxml_html.fromstring(page)
+        etree.strip_elements(tree, 'script', 'style', with_tail=False)
+        text = tree.text_content()
+    except (etree.ParserError, ValueError):
+        text = BeautifulSoup(page, 'html.parser').get_text()
+    return list(dict.fromkeys(EMAIL_PATTERN.findall(text)))
+
+
+scraper = Scraper()
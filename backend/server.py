@@ -1,5 +1,5 @@
-from fastapi import FastAPI, APIRouter, UploadFile, File, HTTPException, BackgroundTasks
-from fastapi.responses import StreamingResponse
+from fastapi import FastAPI, APIRouter, UploadFile, File, HTTPException, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
@@ -7,22 +7,34 @@ import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Callable
 import uuid
 from datetime import datetime
 import csv
 import io
+import json
 import re
-import time
-import dns.resolver
-import smtplib
 import asyncio
+import time
 import threading
-import requests
-from bs4 import BeautifulSoup
 import random
 import tempfile
 
+from smtp_probe import smtp_pool, mx_provider, MAX_RCPTS_PER_SESSION, SOFT_FAIL_CODES, THROTTLE_CODES
+from proxy_pool import Proxy, proxy_pool
+from scraper import scraper
+from pattern_model import PatternModel
+from domain_cache import DomainCache, CATCH_ALL
+from scheduler import run_bulk
+from job_store import JobStore, JobWriter, RowSchema
+from verdict_cache import VerdictCache, CacheLookup, normalise_email
+from retry_queue import RetryQueue
+from blocklists import disposable_domains, role_prefixes
+from prefilter import prefilter_emails, PROBE, DUPLICATE, VERDICTS as PREFILTER_VERDICTS
+import metrics
+from metrics import JOB_ROWS, JOBS_FINISHED, job_timings, timed
+from csv_stream import upload_path, spool_csv, read_header, iter_csv_rows, stream_csv, gzip_stream, MAX_BULK_ROWS
+
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
@@ -31,6 +43,18 @@ mongo_url = os.environ['MONGO_URL']
 client = AsyncIOMotorClient(mongo_url)
 db = client[os.environ['DB_NAME']]
 
+# MX / catch-all verdicts per domain, persisted in Mongo unless disabled
+domain_cache = DomainCache(
+    db.domain_cache if os.environ.get('DOMAIN_CACHE_PERSIST', 'true').lower() == 'true' else None
+)
+
+# Bulk jobs and their results
+job_store = JobStore(db)
+
+# Per-address verdicts shared by every request and job
+verdict_cache = VerdictCache(db.email_verdicts)
+pattern_model = PatternModel(db.email_patterns)
+
 # Create the main app without a prefix
 app = FastAPI()
 
@@ -39,11 +63,27 @@ api_router = APIRouter(prefix="/api")
 
 # Email validation regex
 EMAIL_REGEX = re.compile(r"[^@]+@[^@]+\.[^@]+")
-DISPOSABLE_DOMAINS = {"mailinator.com", "10minutemail.com", "guerrillamail.com", "tempmail.org"}
-ROLE_BASED_PREFIXES = {"info", "support", "admin", "sales", "contact", "noreply", "no-reply"}
 
-# Global storage for job data
-job_data = {}
+SMTP_SENDER = "verifier@example.com"
+
+# Job event stream: rows sent per batch, idle poll interval and keep-alive period (seconds)
+EVENT_BATCH_SIZE = 500
+EVENT_POLL_INTERVAL = 0.5
+EVENT_KEEPALIVE = 15
+
+# Delay before re-probing an address that was greylisted / soft-failed
+GREYLIST_RETRY_DELAY = 5
+
+# Columns bulk jobs add to each uploaded row
+VERIFY_RESULT_COLUMNS = ['status', 'reason']
+FIND_RESULT_COLUMNS = ['found_email', 'status', 'reason', 'confidence', 'candidates']
+# Rows a re-run processes again unless the request names statuses
+RERUN_STATUSES = {'verify': ['risky'], 'find': ['not_found']}
+
+# Largest /verify-batch request, and its default and longest deadline (seconds)
+MAX_BATCH_SIZE = 500
+BATCH_TIMEOUT = 20
+MAX_BATCH_TIMEOUT = 120
 
 # Define Models
 class StatusCheck(BaseModel):
@@ -57,12 +97,29 @@ class StatusCheckCreate(BaseModel):
 class EmailVerifyRequest(BaseModel):
     email: str
     proxy: Optional[str] = None
+    max_age: Optional[int] = None  # seconds; older cached verdicts are re-probed
+    force: bool = False  # skip the verdict cache
 
 class EmailFindRequest(BaseModel):
     firstname: str
     lastname: str
     domain: str
     proxy: Optional[str] = None
+    max_age: Optional[int] = None
+    force: bool = False
+
+class EmailBatchVerifyRequest(BaseModel):
+    emails: List[str]
+    proxy: Optional[str] = None
+    max_age: Optional[int] = None
+    force: bool = False
+    timeout: Optional[float] = Field(None, gt=0)  # seconds; addresses not settled by then come back "pending"
+
+class RerunRequest(BaseModel):
+    statuses: Optional[List[str]] = None  # defaults to risky (verify) / not_found (find) rows
+    reasons: Optional[List[str]] = None  # e.g. ["smtp_timeout"]; any reason when unset
+    max_age: Optional[int] = None
+    force: bool = True  # re-probe instead of answering from the cached verdicts
 
 class ProxyConfig(BaseModel):
     proxies: List[str] = []
@@ -76,119 +133,195 @@ class JobProgress(BaseModel):
     log: str
 
 # Email verification function
-def check_email(email: str, proxy: Optional[str] = None) -> tuple[str, str]:
+def precheck_email(email: str) -> Optional[tuple[str, str]]:
+    """Verdict for addresses that can be rejected without any network work, else None."""
     if not EMAIL_REGEX.match(email):
         return "invalid", "bad_syntax"
 
     domain = email.split('@')[1]
     local = email.split('@')[0]
 
-    if domain.lower() in DISPOSABLE_DOMAINS:
+    if domain in disposable_domains:
         return "invalid", "disposable_domain"
-    if local.lower() in ROLE_BASED_PREFIXES:
+    if local in role_prefixes:
         return "invalid", "role_based"
+    return None
 
-    try:
-        records = dns.resolver.resolve(domain, 'MX')
-        mx_record = str(records[0].exchange)
-    except Exception:
-        return "invalid", "no_mx"
-
-    # Check if domain accepts all emails
-    try:
-        server = smtplib.SMTP(timeout=10)
-        server.connect(mx_record)
-        server.helo("example.com")
-        server.mail("probe@example.com")
-        code, _ = server.rcpt(f"doesnotexist123@{domain}")
-        server.quit()
-        if code == 250:
-            return "risky", "domain_accepts_all"
-    except Exception:
-        pass
-
-    def smtp_check():
-        try:
-            server = smtplib.SMTP(timeout=10)
-            server.connect(mx_record)
-            server.helo("example.com")
-            server.mail("verifier@example.com")
-            code, _ = server.rcpt(email)
-            server.quit()
-            return code
-        except Exception:
-            return None
-
-    code = smtp_check()
-    if code in [421, 450, 451, 452, 503]:
-        time.sleep(5)
-        code = smtp_check()
-
+def verdict_for_code(code: Optional[int]) -> tuple[str, str]:
     if code == 250:
         return "valid", "smtp_ok"
     elif code is None:
         return "risky", "smtp_timeout"
-    elif code in [421, 450, 451, 452, 503]:
+    elif code in SOFT_FAIL_CODES:
         return "risky", f"smtp_soft_fail_{code}"
     elif code == 550:
         return "invalid", "smtp_reject"
     else:
         return "invalid", f"smtp_{code}"
 
-# Email finding function
-def generate_email_patterns(firstname: str, lastname: str, domain: str) -> List[str]:
-    patterns = []
-    first = firstname.lower().strip()
-    last = lastname.lower().strip()
-    
-    if first and last and domain:
-        patterns = [
-            f"{first}.{last}@{domain}",
-            f"{first}@{domain}",
-            f"{first}{last}@{domain}",
-            f"{first[0]}.{last}@{domain}",
-            f"{first}.{last[0]}@{domain}",
-            f"{first[0]}{last}@{domain}",
-            f"{first}{last[0]}@{domain}"
-        ]
-    
-    return patterns
+async def check_email(
+    email: str, proxy: Optional[str] = None, cache: Optional[CacheLookup] = None, retry_soft_fail: bool = True
+) -> tuple[str, str]:
+    with timed("precheck"):
+        verdict = precheck_email(email)
+    if verdict:
+        return verdict
+
+    cache = cache or CacheLookup()
+    cached = await verdict_cache.get(email, cache)
+    if cached:
+        return cached
+
+    verdict = await probe_email(email, retry_soft_fail, proxy)
+    await verdict_cache.put(email, *verdict)
+    return verdict
+
+def is_soft_fail(verdict: tuple[str, str]) -> bool:
+    status, reason = verdict
+    return status == "risky" and reason.startswith("smtp_soft_fail")
+
+def is_throttled(result: tuple) -> bool:
+    """Whether a soft-failed verdict (or bulk find result) was the MX throttling the sender as a whole."""
+    return result[1].endswith(tuple(f"smtp_soft_fail_{code}" for code in THROTTLE_CODES))
+
+async def retry_key(domain: str) -> str:
+    """MX provider whose throttling a parked probe at the domain waits out."""
+    records = await domain_cache.get_mx(domain)
+    return mx_provider(records[0]) if records else domain
+
+async def probe_email(email: str, retry_soft_fail: bool = True, proxy: Optional[str] = None) -> tuple[str, str]:
+    """SMTP verdict for a syntactically valid address; soft fails are retried once inline unless disabled."""
+    domain = email.split('@')[1]
+    records = await domain_cache.get_mx(domain)
+    if records is None:
+        return "risky", "dns_error"
+    if not records:
+        return "invalid", "no_mx"
+
+    # Check if domain accepts all emails (probed once per domain, then cached)
+    if await domain_cache.get_catch_all(domain, records) == CATCH_ALL:
+        return "risky", "domain_accepts_all"
+
+    code = (await smtp_pool.probe_mx(records, SMTP_SENDER, [email], proxy=proxy))[email]
+    if code in SOFT_FAIL_CODES and retry_soft_fail:
+        with timed("greylist_wait"):
+            await asyncio.sleep(GREYLIST_RETRY_DELAY)
+        code = (await smtp_pool.probe_mx(records, SMTP_SENDER, [email], proxy=proxy))[email]
+
+    return verdict_for_code(code)
+
+async def probe_domain_batch(domain: str, emails: List[str], proxy: Optional[str] = None) -> Dict[str, tuple[str, str]]:
+    """Verdicts for several addresses at one domain, sharing its MX lookup, catch-all check and SMTP sessions."""
+    records = await domain_cache.get_mx(domain)
+    if records is None:
+        verdicts = {email: ("risky", "dns_error") for email in emails}
+    elif not records:
+        verdicts = {email: ("invalid", "no_mx") for email in emails}
+    elif await domain_cache.get_catch_all(domain, records) == CATCH_ALL:
+        verdicts = {email: ("risky", "domain_accepts_all") for email in emails}
+    else:
+        async def probe(addresses: List[str]) -> Dict[str, Optional[int]]:
+            # One RCPT batch per session's worth of addresses, spread over the pooled sessions
+            chunks = [addresses[i:i + MAX_RCPTS_PER_SESSION] for i in range(0, len(addresses), MAX_RCPTS_PER_SESSION)]
+            codes = {}
+            for chunk_codes in await asyncio.gather(
+                *(smtp_pool.probe_mx(records, SMTP_SENDER, chunk, proxy=proxy) for chunk in chunks)
+            ):
+                codes.update(chunk_codes)
+            return codes
+
+        codes = await probe(emails)
+        retry = [email for email in emails if codes.get(email) in SOFT_FAIL_CODES]
+        if retry:
+            with timed("greylist_wait"):
+                await asyncio.sleep(GREYLIST_RETRY_DELAY)
+            codes.update(await probe(retry))
+        verdicts = {email: verdict_for_code(codes.get(email)) for email in emails}
+
+    await verdict_cache.put_many(verdicts)
+    return verdicts
+
+# Email finding functions
+async def probe_patterns(
+    patterns: List[str], cache: Optional[CacheLookup] = None, proxy: Optional[str] = None, retry_soft_fail: bool = True
+) -> Optional[tuple[str, str]]:
+    """Probe all candidate addresses for one person in a single RCPT batch.
+
+    Candidates are sent in priority order on one pooled session and the batch stops
+    at the first 250, so the highest ranked hit wins without probing the rest.
+    Candidates with a cached verdict are not probed again. Soft-failed candidates
+    ranked above the first hit are retried once inline unless disabled.
+    Returns (email, reason) like check_email would for that address, or None.
+    """
+    candidates = [pattern for pattern in patterns if precheck_email(pattern) is None]
+    if not candidates:
+        return None
+
+    # Cached verdicts settle the lookup when a hit is ranked above every unknown candidate
+    cache = cache or CacheLookup()
+    verdicts = await verdict_cache.get_many(candidates, cache)
+    for candidate in candidates:
+        if candidate not in verdicts:
+            break
+        status, reason = verdicts[candidate]
+        if status in ["valid", "risky"]:
+            return candidate, reason
+    unknown = [candidate for candidate in candidates if candidate not in verdicts]
+    if not unknown:
+        return None
+
+    domain = unknown[0].split('@')[1]
+    records = await domain_cache.get_mx(domain)
+    if not records:
+        return None
+
+    # Every candidate would come back risky on a catch-all domain, so skip the per-pattern probes
+    if await domain_cache.get_catch_all(domain, records) == CATCH_ALL:
+        return unknown[0], "domain_accepts_all"
 
-def find_email_with_scraping(firstname: str, lastname: str, domain: str, proxy: Optional[str] = None) -> tuple[Optional[str], str]:
-    patterns = generate_email_patterns(firstname, lastname, domain)
+    codes = await smtp_pool.probe_mx(records, SMTP_SENDER, unknown, stop_on=lambda code: code == 250, proxy=proxy)
+
+    # Soft-failed (or unsent) candidates ranked above the first hit decide the outcome, retry them once
+    first_hit = next((i for i, c in enumerate(unknown) if codes.get(c) == 250), len(unknown))
+    retry = [c for c in unknown[:first_hit] if c not in codes or codes[c] in SOFT_FAIL_CODES]
+    if retry and retry_soft_fail:
+        with timed("greylist_wait"):
+            await asyncio.sleep(GREYLIST_RETRY_DELAY)
+        codes.update(await smtp_pool.probe_mx(records, SMTP_SENDER, retry, proxy=proxy))
+
+    probed = {candidate: verdict_for_code(code) for candidate, code in codes.items()}
+    await verdict_cache.put_many(probed)
+    verdicts.update(probed)
+
+    for candidate in candidates:
+        status, reason = verdicts.get(candidate, verdict_for_code(None))
+        if status in ["valid", "risky"]:
+            return candidate, reason
+    return None
+
+async def find_email_with_scraping(
+    firstname: str, lastname: str, domain: str, proxy: Optional[str] = None, cache: Optional[CacheLookup] = None,
+    retry_soft_fail: bool = True
+) -> tuple[Optional[str], str]:
+    # Formats this domain is known to use come first, improbable ones are left out
+    patterns = await pattern_model.candidates(firstname, lastname, domain)
     
     # First try common patterns
-    for pattern in patterns:
-        status, reason = check_email(pattern, proxy)
-        if status in ["valid","risky"]:
-            return pattern, f"found_pattern_{reason}"
+    found = await probe_patterns(patterns, cache, proxy, retry_soft_fail)
+    if found:
+        email, reason = found
+        if reason == "smtp_ok":
+            await pattern_model.record(email, firstname, lastname)
+        return email, f"found_pattern_{reason}"
     
     # Try web scraping if patterns don't work
     try:
-        search_query = f'"{firstname} {lastname}" "{domain}" email'
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-        }
-        
-        proxies = None
-        if proxy:
-            proxies = {'http': proxy, 'https': proxy}
-        
-        # Simple Google search simulation (in real implementation, you'd want more sophisticated scraping)
-        response = requests.get(f"https://www.google.com/search?q={search_query}", 
-                              headers=headers, proxies=proxies, timeout=10)
-        
-        if response.status_code == 200:
-            soup = BeautifulSoup(response.text, 'html.parser')
-            text = soup.get_text()
-            
-            # Look for email patterns in the scraped text
-            email_matches = re.findall(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b', text)
-            for email in email_matches:
-                if domain in email and (firstname.lower() in email.lower() or lastname.lower() in email.lower()):
-                    status, reason = check_email(email, proxy)
-                    if status in ["valid", "risky"]:
-                        return email, f"found_scraping_{reason}"
+        for email in await scraper.find_candidates(firstname, lastname, domain, proxy):
+            status, reason = await check_email(email, proxy, cache, retry_soft_fail)
+            if status == "valid":
+                await pattern_model.record(email, firstname, lastname)
+            if status in ["valid", "risky"]:
+                return email, f"found_scraping_{reason}"
         
         return None, "not_valid_email_found"
     except Exception as e:
@@ -211,25 +344,141 @@ async def get_status_checks():
     status_checks = await db.status_checks.find().to_list(1000)
     return [StatusCheck(**status_check) for status_check in status_checks]
 
+async def use_proxy(proxy: Optional[str]):
+    """Validate a request's explicit proxy and bring the shared proxy pool up to date."""
+    if proxy:
+        try:
+            Proxy(proxy)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    await proxy_pool.refresh(db.settings)
+
+@api_router.get("/proxies")
+async def get_proxies():
+    await proxy_pool.refresh(db.settings)
+    return {"proxies": proxy_pool.stats()}
+
+@api_router.post("/proxies")
+async def set_proxies(config: ProxyConfig):
+    urls = [url.strip() for url in config.proxies if url.strip()]
+    try:
+        await proxy_pool.save(db.settings, urls)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"proxies": proxy_pool.stats()}
+
+@api_router.get("/blocklists")
+async def get_blocklists():
+    return {"disposable_domains": disposable_domains.stats(), "role_prefixes": role_prefixes.stats()}
+
+@api_router.post("/blocklists/reload")
+async def reload_blocklists():
+    # Other workers pick the change up within RELOAD_CHECK_INTERVAL on their own
+    await asyncio.to_thread(disposable_domains.reload)
+    await asyncio.to_thread(role_prefixes.reload)
+    return await get_blocklists()
+
 @api_router.post("/verify-single")
 async def verify_single_email(request: EmailVerifyRequest):
-    status, reason = check_email(request.email, request.proxy)
+    await use_proxy(request.proxy)
+    cache = CacheLookup(max_age=request.max_age, force=request.force)
+    status, reason = await check_email(request.email, request.proxy, cache)
     return {
         "email": request.email,
         "status": status,
         "reason": reason,
+        "cached": cache.hits > 0,
+        "timestamp": datetime.utcnow()
+    }
+
+# Batch probes still running after their request's deadline; their verdicts still reach the verdict cache
+batch_probes: set = set()
+
+def finish_in_background(task: asyncio.Task):
+    batch_probes.add(task)
+
+    def done(task: asyncio.Task):
+        batch_probes.discard(task)
+        if not task.cancelled() and task.exception():
+            logger.warning(f"Background batch probe failed: {task.exception()}")
+
+    task.add_done_callback(done)
+
+@api_router.post("/verify-batch")
+async def verify_batch_emails(request: EmailBatchVerifyRequest):
+    if len(request.emails) > MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=400, detail=f"At most {MAX_BATCH_SIZE} emails per batch, use /verify-bulk for more"
+        )
+    started = time.monotonic()
+    timeout = min(BATCH_TIMEOUT if request.timeout is None else request.timeout, MAX_BATCH_TIMEOUT)
+    await use_proxy(request.proxy)
+    cache = CacheLookup(max_age=request.max_age, force=request.force)
+
+    # Repeated addresses are checked once
+    verdicts: Dict[str, tuple[str, str]] = {}
+    unknown: Dict[str, str] = {}
+    for email in request.emails:
+        address = email.strip()
+        key = normalise_email(address)
+        if key in verdicts or key in unknown:
+            continue
+        verdict = precheck_email(address)
+        if verdict:
+            verdicts[key] = verdict
+        else:
+            unknown[key] = address
+
+    cached = await verdict_cache.get_many(list(unknown.values()), cache)
+    cached_keys = {normalise_email(address) for address in cached}
+    for address, verdict in cached.items():
+        key = normalise_email(address)
+        verdicts[key] = verdict
+        del unknown[key]
+
+    by_domain: Dict[str, List[str]] = {}
+    for address in unknown.values():
+        by_domain.setdefault(address.split('@')[1].lower(), []).append(address)
+    tasks = {
+        asyncio.create_task(probe_domain_batch(domain, addresses, request.proxy)): addresses
+        for domain, addresses in by_domain.items()
+    }
+    if tasks:
+        done, pending = await asyncio.wait(tasks, timeout=max(timeout - (time.monotonic() - started), 0))
+        for task in done:
+            try:
+                for address, verdict in task.result().items():
+                    verdicts[normalise_email(address)] = verdict
+            except Exception as e:
+                logger.warning(f"Batch probe failed: {e}")
+                for address in tasks[task]:
+                    verdicts[normalise_email(address)] = ("risky", "check_failed")
+        for task in pending:
+            finish_in_background(task)
+
+    results = []
+    for email in request.emails:
+        key = normalise_email(email)
+        status, reason = verdicts.get(key, ("pending", "deadline_exceeded"))
+        results.append({"email": email, "status": status, "reason": reason, "cached": key in cached_keys})
+    return {
+        "results": results,
+        "pending": sum(1 for result in results if result["status"] == "pending"),
+        "cached": cache.hits,
         "timestamp": datetime.utcnow()
     }
 
 @api_router.post("/find-single")
 async def find_single_email(request: EmailFindRequest):
-    email, reason = find_email_with_scraping(
+    await use_proxy(request.proxy)
+    email, reason = await find_email_with_scraping(
         request.firstname, 
         request.lastname, 
         request.domain, 
-        request.proxy
+        request.proxy,
+        CacheLookup(max_age=request.max_age, force=request.force)
     )
-    return {
+    response = {
         "firstname": request.firstname,
         "lastname": request.lastname,
         "domain": request.domain,
@@ -237,202 +486,610 @@ async def find_single_email(request: EmailFindRequest):
         "reason": reason,
         "timestamp": datetime.utcnow()
     }
+    if reason.endswith("domain_accepts_all"):
+        # Any candidate would be accepted: return the ranking instead of a verified address
+        email, confidence, ranked = await catch_all_guess(request.firstname, request.lastname, request.domain)
+        response.update(
+            found_email=email,
+            confidence=round(confidence, 2),
+            candidates=[{"email": candidate, "confidence": round(p, 2)} for candidate, p in ranked],
+        )
+    return response
 
 @api_router.post("/verify-bulk")
-async def verify_bulk_emails(background_tasks: BackgroundTasks, file: UploadFile = File(...)):
+async def verify_bulk_emails(file: UploadFile = File(...), max_age: Optional[int] = None, force: bool = False):
     if not file.filename.endswith('.csv'):
         raise HTTPException(status_code=400, detail="File must be a CSV")
     
     job_id = str(uuid.uuid4())
-    content = await file.read()
-    content_str = content.decode('utf-8')
+    path = upload_path(job_id)
     
     try:
-        reader = list(csv.DictReader(io.StringIO(content_str)))
-        total = len(reader)
+        fieldnames, total = await asyncio.to_thread(spool_csv, file.file, path)
         
-        if total > 1000:
-            raise HTTPException(status_code=400, detail="Maximum 1000 records allowed")
+        if total == 0:
+            raise HTTPException(status_code=400, detail="CSV contains no records")
+        if total > MAX_BULK_ROWS:
+            raise HTTPException(status_code=400, detail=f"Maximum {MAX_BULK_ROWS} records allowed")
         
-        email_field = next((f for f in reader[0].keys() if f.lower().strip() == 'email'), None)
+        email_field = next((f for f in fieldnames if f.lower().strip() == 'email'), None)
         if not email_field:
             raise HTTPException(status_code=400, detail="CSV must contain 'email' column")
         
-        job_data[job_id] = {
-            "progress": 0,
-            "current_row": 0,
-            "total_rows": total,
-            "status": "processing",
-            "log": "Starting bulk verification...",
-            "results": [],
-            "filename": file.filename,
-            "type": "verify"
-        }
-        
-        background_tasks.add_task(process_bulk_verification, job_id, reader, email_field)
+        # Queued for the job runners, which pick up processing jobs (and their uploads) from the store
+        await job_store.save_upload(job_id, path)
+        await job_store.create_job(
+            job_id, "verify", file.filename, total, "Starting bulk verification...",
+            params={"email_field": email_field, "max_age": max_age, "force": force}
+        )
         
         return {"job_id": job_id, "total_rows": total}
     except Exception as e:
+        await job_store.delete_upload(job_id)
         raise HTTPException(status_code=400, detail=f"Error processing CSV: {str(e)}")
+    finally:
+        path.unlink(missing_ok=True)
 
 @api_router.post("/find-bulk")
-async def find_bulk_emails(background_tasks: BackgroundTasks, file: UploadFile = File(...)):
+async def find_bulk_emails(file: UploadFile = File(...), max_age: Optional[int] = None, force: bool = False):
     if not file.filename.endswith('.csv'):
         raise HTTPException(status_code=400, detail="File must be a CSV")
     
     job_id = str(uuid.uuid4())
-    content = await file.read()
-    content_str = content.decode('utf-8')
+    path = upload_path(job_id)
     
     try:
-        reader = list(csv.DictReader(io.StringIO(content_str)))
-        total = len(reader)
+        fieldnames, total = await asyncio.to_thread(spool_csv, file.file, path)
         
-        if total > 1000:
-            raise HTTPException(status_code=400, detail="Maximum 1000 records allowed")
+        if total == 0:
+            raise HTTPException(status_code=400, detail="CSV contains no records")
+        if total > MAX_BULK_ROWS:
+            raise HTTPException(status_code=400, detail=f"Maximum {MAX_BULK_ROWS} records allowed")
         
         required_fields = ['firstname', 'lastname', 'domain']
-        missing_fields = [f for f in required_fields if not any(f.lower() == col.lower().strip() for col in reader[0].keys())]
+        missing_fields = [f for f in required_fields if not any(f.lower() == col.lower().strip() for col in fieldnames)]
         
         if missing_fields:
             raise HTTPException(status_code=400, detail=f"CSV must contain columns: {', '.join(missing_fields)}")
         
-        job_data[job_id] = {
-            "progress": 0,
-            "current_row": 0,
-            "total_rows": total,
-            "status": "processing",
-            "log": "Starting bulk email finding...",
-            "results": [],
-            "filename": file.filename,
-            "type": "find"
-        }
-        
-        background_tasks.add_task(process_bulk_finding, job_id, reader)
+        # Queued for the job runners, which pick up processing jobs (and their uploads) from the store
+        await job_store.save_upload(job_id, path)
+        await job_store.create_job(
+            job_id, "find", file.filename, total, "Starting bulk email finding...",
+            params={"max_age": max_age, "force": force}
+        )
         
         return {"job_id": job_id, "total_rows": total}
     except Exception as e:
+        await job_store.delete_upload(job_id)
         raise HTTPException(status_code=400, detail=f"Error processing CSV: {str(e)}")
+    finally:
+        path.unlink(missing_ok=True)
+
+@api_router.post("/rerun/{job_id}")
+async def rerun_job(job_id: str, request: RerunRequest):
+    """Queue a new job over an earlier job's upload that only re-runs some of its rows.
+
+    Rows whose status (and reason, when given) match the request are processed
+    again; every other finished row is carried over as already completed, so the
+    runner skips it like a row finished before a resume. Rows the earlier job
+    never finished (it failed) are always run. The runner copies the upload and
+    the carried rows (see prepare_rerun) before it starts.
+    """
+    old = await job_store.get_job(job_id)
+    if not old:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if old['status'] == 'processing':
+        raise HTTPException(status_code=409, detail="Job is still processing")
+    # Finished jobs don't keep their upload, the input values are in the stored rows
+    rebuildable = old['status'] == 'completed' and old.get('input_columns')
+    if not rebuildable and not await job_store.has_upload(job_id):
+        raise HTTPException(status_code=400, detail="The job's upload is no longer available")
+
+    new_id = str(uuid.uuid4())
+    await job_store.create_job(
+        new_id, old['type'], old['filename'], old['total_rows'], f"♻️ Queued re-run of job {job_id}...",
+        params={
+            **old['params'], "max_age": request.max_age, "force": request.force,
+            "rerun_of": job_id, "statuses": request.statuses, "reasons": request.reasons,
+        }
+    )
+    return {"job_id": new_id, "total_rows": old['total_rows'], "rerun_of": job_id}
+
+def rerun_filter(
+    columns: List[str], job_type: str, statuses: Optional[List[str]], reasons: Optional[List[str]]
+) -> Callable[[List[Any]], bool]:
+    """`keep` for JobStore.copy_rows: whether a row of the earlier job is carried over rather than re-run."""
+    statuses = set(statuses or RERUN_STATUSES[job_type])
+    reasons = set(reasons) if reasons else None
+    status_at = columns.index('status') if 'status' in columns else None
+    reason_at = columns.index('reason') if 'reason' in columns else None
+
+    def keep(values: List[Any]) -> bool:
+        rerun = status_at is not None and values[status_at] in statuses
+        if rerun and reasons is not None:
+            rerun = reason_at is not None and values[reason_at] in reasons
+        return not rerun
+
+    return keep
+
+async def prepare_rerun(job: Dict, path: Path) -> Optional[int]:
+    """Store a re-run job's upload and the rows it carries over; returns how many, None when the upload is gone.
+
+    Safe to repeat when a runner dies half way: the upload copy replaces any
+    earlier one and rows that are already stored are skipped.
+    """
+    params = job['params']
+    old = await job_store.get_job(params['rerun_of'])
+    if old is None:
+        return None
+    if not await job_store.copy_upload(old['job_id'], job['job_id']):
+        if old['status'] != 'completed' or not old.get('input_columns'):
+            return None
+        await job_store.write_inputs(old, path)
+        await job_store.save_upload(job['job_id'], path)
+
+    keep = rerun_filter(await job_store.columns(old), old['type'], params.get('statuses'), params.get('reasons'))
+    carried = await job_store.copy_rows(old, job['job_id'], keep)
+    await job_store.update_job(
+        job['job_id'], rerun_prepared=True, current_row=carried,
+        log=f"♻️ Re-running {job['total_rows'] - carried} rows of job {old['job_id']}..."
+    )
+    return carried
+
+async def scan_domains(path: Path, domain_of) -> set:
+    return await asyncio.to_thread(lambda: {d for d in map(domain_of, iter_csv_rows(path)) if d})
+
+async def prefetch_domains(job_id: str, domains: set) -> set:
+    """Resolve the MX records of every distinct domain in the upload before any SMTP work.
+
+    Returns the domains without MX; their rows can be settled without probing.
+    """
+    await job_store.update_job(job_id, log=f"🌐 Resolving MX records for {len(domains)} domains...")
+    with timed("prefetch_mx"):
+        return await domain_cache.prefetch_mx(domains)
+
+async def catch_all_guess(firstname: str, lastname: str, domain: str) -> tuple[Optional[str], float, List[tuple[str, float]]]:
+    """Best candidate, its confidence and the full ranking for a domain that accepts every address."""
+    ranked = await pattern_model.ranked(firstname, lastname, domain)
+    if not ranked:
+        return None, 0.0, []
+    email, confidence = ranked[0]
+    return email, confidence, ranked
+
+def format_candidates(ranked: List[tuple[str, float]]) -> str:
+    return "; ".join(f"{email} ({confidence:.2f})" for email, confidence in ranked)
+
+async def process_bulk_verification(job_id: str, path: Path, email_field: str, total: int, cache: CacheLookup):
+    writer = JobWriter(job_store, job_id)
+    completed = 0
+
+    def row_email(row: Dict) -> str:
+        return (row.get(email_field) or '').strip()
+
+    def email_domain(row: Dict) -> Optional[str]:
+        email = row_email(row)
+        return email.split('@')[1].lower() if EMAIL_REGEX.match(email) else None
+
+    dead_domains: set = set()
+    # Verdicts of first rows whose address repeats later in the file
+    repeated: set = set()
+    first_verdicts: Dict[int, tuple[str, str]] = {}
+
+    async def verify_row(row: Dict) -> tuple[str, str]:
+        email = row_email(row)
+        if not email:
+            return 'invalid', 'empty_email'
+        if email_domain(row) in dead_domains:
+            return precheck_email(email) or ('invalid', 'no_mx')
+        # Greylisted addresses are parked in the retry queue instead of sleeping here
+        with timed("verify_email"):
+            return await check_email(email, cache=cache, retry_soft_fail=False)
+
+    async def finish_row(index: int, row: Dict, verdict: tuple[str, str]):
+        nonlocal completed
+        status, reason = verdict
+        completed += 1
+        JOB_ROWS.inc(type="verify")
+        if index in repeated:
+            first_verdicts[index] = verdict
+
+        percent = int((completed / total) * 100)
+        await writer.add(
+            index,
+            schema.values(row, status, reason),
+            status,
+            seq=completed,
+            progress=percent,
+            current_row=completed,
+            cache_hits=cache.hits,
+            cache_misses=cache.misses,
+            log=f"✅ {row_email(row)} → {status} ({reason})"
+        )
+
+    async def retry_row(item: tuple[int, Dict]) -> tuple[str, str]:
+        email = row_email(item[1])
+        verdict = await probe_email(email, retry_soft_fail=False)
+        await verdict_cache.put(email, *verdict)
+        return verdict
+
+    async def retried(item: tuple[int, Dict], verdict: tuple[str, str]):
+        await finish_row(item[0], item[1], verdict)
+
+    retries = RetryQueue(retry_row, is_soft_fail, retried, is_throttled=is_throttled)
+
+    async def record_result(index: int, row: Dict, verdict: tuple[str, str]):
+        if is_soft_fail(verdict):
+            key = await retry_key(email_domain(row))
+            if is_throttled(verdict):
+                retries.throttle(key)
+            retries.defer((index, row), key=key)
+        else:
+            await finish_row(index, row, verdict)
 
-def process_bulk_verification(job_id: str, reader: List[Dict], email_field: str):
     try:
-        for i, row in enumerate(reader, 1):
-            email = (row.get(email_field) or '').strip()
-            if not email:
-                status, reason = 'invalid', 'empty_email'
-            else:
-                status, reason = check_email(email)
-            
-            result = {**row, 'status': status, 'reason': reason}
-            job_data[job_id]['results'].append(result)
-            
-            percent = int((i / len(reader)) * 100)
-            job_data[job_id].update({
-                "progress": percent,
-                "current_row": i,
-                "log": f"✅ {email} → {status} ({reason})"
-            })
-            
-            time.sleep(0.1)  # Small delay to prevent overwhelming servers
+        schema = RowSchema(read_header(path), VERIFY_RESULT_COLUMNS)
+        await job_store.update_job(job_id, columns=schema.columns, input_columns=schema.input_columns)
+        # Rows already stored by an earlier, interrupted run are skipped
+        done = await job_store.completed_rows(job_id, total)
+        completed = sum(done)
+
+        # Junk and repeated addresses are sorted out column-wise, before any network work
+        with timed("prefilter"):
+            prefilter = await asyncio.to_thread(
+                prefilter_emails, path, email_field, EMAIL_REGEX, disposable_domains, role_prefixes
+            )
+        if prefilter is not None and len(prefilter.kinds) != total:
+            # The column parser and csv.DictReader disagree about this file's rows
+            prefilter = None
+        if prefilter is None:
+            domains = await scan_domains(path, email_domain)
+        else:
+            domains = prefilter.domains
+            repeated.update(prefilter.first_of[prefilter.first_of >= 0].tolist())
+            counts = prefilter.counts()
+            await job_store.update_job(
+                job_id,
+                log=f"🧹 {counts.get(PROBE, 0)} unique addresses to check, {counts.get(DUPLICATE, 0)} repeats, "
+                    f"{total - counts.get(PROBE, 0) - counts.get(DUPLICATE, 0)} rejected without probing"
+            )
+        dead_domains.update(await prefetch_domains(job_id, domains))
+
+        def to_probe(index: int) -> bool:
+            return not done[index] and (prefilter is None or prefilter.kinds[index] == PROBE)
+
+        pending = ((i, row) for i, row in enumerate(iter_csv_rows(path)) if to_probe(i))
+        await run_bulk(pending, email_domain, verify_row, record_result)
+        await retries.drain()
+
+        if prefilter is not None:
+            # Rows settled by the pre-pass, and repeats of the probed addresses
+            for i, row in enumerate(iter_csv_rows(path)):
+                kind = prefilter.kinds[i]
+                if done[i] or kind == PROBE:
+                    continue
+                if kind == DUPLICATE:
+                    verdict = first_verdicts.get(int(prefilter.first_of[i]))
+                    if verdict is None:
+                        # The first row finished in an earlier run, its verdict is in the cache
+                        verdict = await check_email(row_email(row), cache=cache, retry_soft_fail=False)
+                else:
+                    verdict = PREFILTER_VERDICTS[kind]
+                await finish_row(i, row, verdict)
+        await writer.flush()
         
-        job_data[job_id]['status'] = 'completed'
-        job_data[job_id]['log'] = f"✅ Completed verification of {len(reader)} emails"
+        await job_store.update_job(
+            job_id, status='completed', cache_hits=cache.hits, cache_misses=cache.misses,
+            log=f"✅ Completed verification of {total} emails ({cache.hits} cached verdicts)"
+        )
+    except asyncio.CancelledError:
+        # Runner is shutting down: keep what is finished, the job resumes elsewhere
+        retries.cancel()
+        await writer.flush()
+        raise
     except Exception as e:
-        job_data[job_id]['status'] = 'error'
-        job_data[job_id]['log'] = f"❌ Error: {str(e)}"
+        retries.cancel()
+        await job_store.update_job(job_id, status='error', log=f"❌ Error: {str(e)}")
+
+async def process_bulk_finding(job_id: str, path: Path, total: int, cache: CacheLookup):
+    writer = JobWriter(job_store, job_id)
+    completed = 0
+
+    def row_domain(row: Dict) -> Optional[str]:
+        return (row.get('domain') or '').strip().lower() or None
+
+    def row_name(row: Dict) -> str:
+        firstname, lastname, domain = ((row.get(f) or '').strip() for f in ('firstname', 'lastname', 'domain'))
+        return f"{firstname} {lastname}@{domain}"
+
+    dead_domains: set = set()
+    catch_all_domains: set = set()
+
+    async def find_row(row: Dict, lookup: CacheLookup) -> tuple:
+        """(found_email, reason, confidence, ranked, probed) for one row."""
+        firstname = (row.get('firstname') or '').strip()
+        lastname = (row.get('lastname') or '').strip()
+        domain = (row.get('domain') or '').strip()
+        confidence, ranked, probed = None, [], False
+        
+        if not all([firstname, lastname, domain]):
+            found_email, reason = None, 'missing_data'
+        elif row_domain(row) in dead_domains:
+            found_email, reason = None, 'no_mx'
+        elif row_domain(row) in catch_all_domains:
+            found_email, confidence, ranked = await catch_all_guess(firstname, lastname, domain)
+            reason = 'found_pattern_domain_accepts_all'
+        else:
+            # Greylisted candidates are parked in the retry queue instead of sleeping here
+            with timed("find_email"):
+                found_email, reason = await find_email_with_scraping(
+                    firstname, lastname, domain, cache=lookup, retry_soft_fail=False
+                )
+            probed = True
+            if reason.endswith('domain_accepts_all'):
+                found_email, confidence, ranked = await catch_all_guess(firstname, lastname, domain)
+            elif reason.endswith('smtp_ok'):
+                confidence = 1.0
+        return found_email, reason, confidence, ranked, probed
+
+    def soft_failed(result: tuple) -> bool:
+        return 'smtp_soft_fail' in result[1]
+
+    async def finish_row(index: int, row: Dict, result: tuple):
+        nonlocal completed
+        found_email, reason, confidence, ranked, _ = result
+        status = 'found' if found_email else 'not_found'
+        values = schema.values(
+            row,
+            found_email or 'Not Found',
+            status,
+            reason,
+            round(confidence, 2) if confidence is not None else '',
+            format_candidates(ranked),
+        )
+        
+        completed += 1
+        JOB_ROWS.inc(type="find")
+        percent = int((completed / total) * 100)
+        await writer.add(
+            index,
+            values,
+            status,
+            seq=completed,
+            progress=percent,
+            current_row=completed,
+            cache_hits=cache.hits,
+            cache_misses=cache.misses,
+            log=f"🔍 {row_name(row)} → {found_email or 'Not Found'}"
+        )
+
+    async def retry_row(item: tuple[int, Dict]) -> tuple:
+        # The soft-failed verdicts are cached, so the retry probes afresh
+        result = await find_row(item[1], CacheLookup(force=True))
+        if result[4]:
+            await asyncio.sleep(0.5)
+        return result
+
+    async def retried(item: tuple[int, Dict], result: tuple):
+        await finish_row(item[0], item[1], result)
+
+    # One retry at a time, paced like the rows themselves
+    retries = RetryQueue(retry_row, soft_failed, retried, is_throttled=is_throttled, concurrency=1)
 
-def process_bulk_finding(job_id: str, reader: List[Dict]):
     try:
-        for i, row in enumerate(reader, 1):
-            firstname = (row.get('firstname') or '').strip()
-            lastname = (row.get('lastname') or '').strip()
-            domain = (row.get('domain') or '').strip()
-            
-            if not all([firstname, lastname, domain]):
-                found_email, reason = None, 'missing_data'
+        schema = RowSchema(read_header(path), FIND_RESULT_COLUMNS)
+        await job_store.update_job(job_id, columns=schema.columns, input_columns=schema.input_columns)
+        # Rows already stored by an earlier, interrupted run are skipped
+        done = await job_store.completed_rows(job_id, total)
+        completed = sum(done)
+
+        domains = await scan_domains(path, row_domain)
+        dead_domains.update(await prefetch_domains(job_id, domains))
+        # Every candidate at a catch-all domain would be accepted, so those rows skip SMTP entirely
+        await job_store.update_job(job_id, log=f"📬 Checking {len(domains) - len(dead_domains)} domains for catch-all...")
+        with timed("prefetch_catch_all"):
+            catch_all_domains.update(await domain_cache.prefetch_catch_all(domains - dead_domains))
+
+        for i, row in enumerate(iter_csv_rows(path)):
+            if done[i]:
+                continue
+            result = await find_row(row, cache)
+            if soft_failed(result):
+                key = await retry_key(row_domain(row))
+                if is_throttled(result):
+                    retries.throttle(key)
+                retries.defer((i, row), key=key)
             else:
-                found_email, reason = find_email_with_scraping(firstname, lastname, domain)
-            
-            result = {
-                **row, 
-                'found_email': found_email or 'Not Found',
-                'status': 'found' if found_email else 'not_found',
-                'reason': reason
-            }
-            job_data[job_id]['results'].append(result)
+                await finish_row(i, row, result)
             
-            percent = int((i / len(reader)) * 100)
-            job_data[job_id].update({
-                "progress": percent,
-                "current_row": i,
-                "log": f"🔍 {firstname} {lastname}@{domain} → {found_email or 'Not Found'}"
-            })
-            
-            time.sleep(0.5)  # Longer delay for finding to prevent rate limiting
+            if result[4]:
+                await asyncio.sleep(0.5)  # Longer delay for finding to prevent rate limiting
+        await retries.drain()
+        await writer.flush()
         
-        job_data[job_id]['status'] = 'completed'
-        job_data[job_id]['log'] = f"✅ Completed finding emails for {len(reader)} records"
+        await job_store.update_job(
+            job_id, status='completed', cache_hits=cache.hits, cache_misses=cache.misses,
+            log=f"✅ Completed finding emails for {total} records ({cache.hits} cached verdicts)"
+        )
+    except asyncio.CancelledError:
+        # Runner is shutting down: keep what is finished, the job resumes elsewhere
+        retries.cancel()
+        await writer.flush()
+        raise
     except Exception as e:
-        job_data[job_id]['status'] = 'error'
-        job_data[job_id]['log'] = f"❌ Error: {str(e)}"
+        retries.cancel()
+        await job_store.update_job(job_id, status='error', log=f"❌ Error: {str(e)}")
 
-@api_router.get("/job-progress/{job_id}")
-async def get_job_progress(job_id: str):
-    job = job_data.get(job_id)
-    if not job:
-        raise HTTPException(status_code=404, detail="Job not found")
-    
+async def run_job(job: Dict):
+    """Entry point for the job runners (see worker.py)."""
+    await proxy_pool.refresh(db.settings, max_age=0)
+    params = job['params']
+    # The runner that took the job may not be on the host it was uploaded to
+    path = upload_path(job['job_id'])
+    if params.get('rerun_of') and not job.get('rerun_prepared'):
+        carried = await prepare_rerun(job, path)
+        if carried is None:
+            await job_store.update_job(job['job_id'], status='error', log="❌ Error: the re-run job's upload is missing")
+            return
+        job = {**job, 'current_row': carried}
+    if not path.exists() and not await job_store.fetch_upload(job['job_id'], path):
+        await job_store.update_job(job['job_id'], status='error', log="❌ Error: the job's upload is missing")
+        return
+    # Counts carry over when a job is resumed
+    cache = CacheLookup(
+        max_age=params.get('max_age'),
+        force=params.get('force', False),
+        hits=job.get('cache_hits', 0),
+        misses=job.get('cache_misses', 0),
+    )
+    with job_timings() as timings:
+        if job['type'] == 'verify':
+            await process_bulk_verification(job['job_id'], path, params['email_field'], job['total_rows'], cache)
+        else:
+            await process_bulk_finding(job['job_id'], path, job['total_rows'], cache)
+
+    # Where this run's time went, kept on the job next to its results
+    finished = await job_store.get_job(job['job_id']) or {}
+    # A failed job keeps its stored upload, so it can be re-run
+    if finished.get('status') == 'completed':
+        await job_store.delete_upload(job['job_id'])
+    path.unlink(missing_ok=True)
+    JOBS_FINISHED.inc(type=job['type'], status=finished.get('status', 'unknown'))
+    elapsed = time.monotonic() - timings.started
+    rows = finished.get('current_row', 0) - job.get('current_row', 0)
+    await job_store.update_job(
+        job['job_id'],
+        timings=timings.summary(),
+        run_seconds=round(elapsed, 1),
+        rows_per_sec=round(rows / elapsed, 2) if elapsed > 0 else 0,
+    )
+
+def job_progress(job_id: str, job: Dict) -> Dict:
     return {
         "job_id": job_id,
         "progress": job.get("progress", 0),
         "current_row": job.get("current_row", 0),
         "total_rows": job.get("total_rows", 0),
         "status": job.get("status", "unknown"),
-        "log": job.get("log", "")
+        "log": job.get("log", ""),
+        "cache_hits": job.get("cache_hits", 0),
+        "cache_misses": job.get("cache_misses", 0),
+        "rows_per_sec": job.get("rows_per_sec"),
+        "timings": job.get("timings"),
     }
 
+@api_router.get("/job-progress/{job_id}")
+async def get_job_progress(job_id: str):
+    job = await job_store.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    return job_progress(job_id, job)
+
+def sse_event(event: str, data: Dict, event_id: Optional[int] = None) -> str:
+    lines = [f"event: {event}"]
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"data: {json.dumps(data, default=str)}")
+    return "\n".join(lines) + "\n\n"
+
+async def job_event_stream(job_id: str, after: int, include_rows: bool):
+    """Yield progress and per-row events until the job finishes.
+
+    Row events carry their completion sequence number as the SSE id, so a client
+    reconnecting with Last-Event-ID (or ?after=) continues where it left off. The
+    next batch is only read once the previous one has been sent, so a slow client
+    holds back the stream instead of buffering it on the server.
+    """
+    last_progress = None
+    idle_since = time.monotonic()
+    while True:
+        # Read the job before its rows: rows are flushed before a job is marked finished
+        job = await job_store.get_job(job_id)
+        if not job:
+            return
+
+        rows = await job_store.rows_after(job_id, after, EVENT_BATCH_SIZE) if include_rows else []
+        for row in rows:
+            after = row['seq']
+            if 'values' in row:
+                # Stored compactly; events carry the row as a dict
+                row['result'] = dict(zip(job.get('columns', []), row.pop('values')))
+            yield sse_event("row", row, event_id=after)
+
+        progress = job_progress(job_id, job)
+        if progress != last_progress:
+            yield sse_event("progress", progress)
+            last_progress = progress
+            idle_since = time.monotonic()
+
+        if job['status'] != 'processing' and len(rows) < EVENT_BATCH_SIZE:
+            yield sse_event("done", progress)
+            return
+
+        if len(rows) < EVENT_BATCH_SIZE:
+            if time.monotonic() - idle_since >= EVENT_KEEPALIVE:
+                yield ": keep-alive\n\n"
+                idle_since = time.monotonic()
+            await asyncio.sleep(EVENT_POLL_INTERVAL)
+
+@api_router.get("/job-events/{job_id}")
+async def stream_job_events(job_id: str, request: Request, after: int = 0, rows: bool = True):
+    job = await job_store.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    last_event_id = request.headers.get("last-event-id", "")
+    if last_event_id.isdigit():
+        after = int(last_event_id)
+    
+    return StreamingResponse(
+        job_event_stream(job_id, after, rows),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @api_router.get("/download-results/{job_id}")
-async def download_results(job_id: str, filter_type: str = "all"):
-    job = job_data.get(job_id)
-    if not job or job['status'] != 'completed':
+async def download_results(job_id: str, filter_type: str = "all", partial: bool = False, gzip: bool = False):
+    job = await job_store.get_job(job_id)
+    if not job or (job['status'] != 'completed' and not partial):
         raise HTTPException(status_code=404, detail="Job not found or not completed")
     
-    results = job['results']
-    
     # Filter results based on type
-    if filter_type == "valid" and job['type'] == 'verify':
-        filtered = [r for r in results if r.get('status') == 'valid']
-    elif filter_type == "risky" and job['type'] == 'verify':
-        filtered = [r for r in results if r.get('status') == 'risky']
-    elif filter_type == "invalid" and job['type'] == 'verify':
-        filtered = [r for r in results if r.get('status') == 'invalid']
-    elif filter_type == "found" and job['type'] == 'find':
-        filtered = [r for r in results if r.get('status') == 'found']
-    elif filter_type == "not_found" and job['type'] == 'find':
-        filtered = [r for r in results if r.get('status') == 'not_found']
+    if filter_type in ("valid", "risky", "invalid") and job['type'] == 'verify':
+        status_filter = filter_type
+    elif filter_type in ("found", "not_found") and job['type'] == 'find':
+        status_filter = filter_type
     else:
-        filtered = results
+        status_filter = None
     
-    if not filtered:
+    # Rows are streamed from the job store as value lists in the job's column order
+    results = job_store.iter_results(job_id, status_filter)
+    first = await anext(results, None)
+    if first is None:
         raise HTTPException(status_code=404, detail="No results found for the specified filter")
     
-    # Create CSV output
-    output = io.StringIO()
-    if filtered:
-        writer = csv.DictWriter(output, fieldnames=filtered[0].keys())
-        writer.writeheader()
-        for row in filtered:
-            writer.writerow(row)
-    
-    output.seek(0)
+    body = stream_csv(results, await job_store.columns(job), [first])
     filename = f"{filter_type}-{job['filename']}"
+    media_type = "text/csv"
+    if gzip:
+        body = gzip_stream(body)
+        filename += ".gz"
+        media_type = "application/gzip"
     
     return StreamingResponse(
-        io.BytesIO(output.getvalue().encode()),
-        media_type="text/csv",
+        body,
+        media_type=media_type,
         headers={"Content-Disposition": f"attachment; filename={filename}"}
     )
 
+@api_router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Prometheus metrics of every API and job runner process that reported recently."""
+    snapshots = await metrics.collect(db.metrics)
+    jobs = metrics.render_gauge("helpfinder_jobs", "Bulk jobs by state", "state", await job_store.queue_depth())
+    return PlainTextResponse(metrics.render(snapshots, jobs), media_type="text/plain; version=0.0.4")
+
 @api_router.get("/download-template/{template_type}")
 async def download_template(template_type: str):
     if template_type == "verify":
@@ -482,6 +1139,29 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def create_indexes():
+    await domain_cache.ensure_indexes()
+    await job_store.ensure_indexes()
+    await verdict_cache.ensure_indexes()
+    await metrics.ensure_indexes(db.metrics)
+
+metrics_publisher: Optional[asyncio.Task] = None
+
+@app.on_event("startup")
+async def start_metrics_publisher():
+    global metrics_publisher
+    metrics_publisher = asyncio.create_task(metrics.publish_loop(db.metrics))
+
+@app.on_event("shutdown")
+async def stop_metrics_publisher():
+    if metrics_publisher is not None:
+        metrics_publisher.cancel()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
     client.close()
+
+@app.on_event("shutdown")
+async def shutdown_smtp_pool():
+    await smtp_pool.close()
@@ -0,0 +1,376 @@
+import asyncio
+import os
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import dns.asyncresolver
+import dns.resolver
+
+from metrics import SMTP_IN_FLIGHT, SMTP_PROBE_SECONDS, SMTP_RESPONSES, timed
+from proxy_pool import Proxy, ProxyError, open_socks_connection, proxy_pool
+from rate_limit import KeyedRateLimiter
+
+SMTP_PORT = 25
+SMTP_TIMEOUT = 10
+DNS_TIMEOUT = 10
+HELO_HOST = "example.com"
+
+# Session pool limits; the session cap is shared by all MX hosts of one provider
+MAX_SESSIONS_PER_PROVIDER = int(os.environ.get('MAX_SESSIONS_PER_PROVIDER', 2))
+SESSION_IDLE_TIMEOUT = 30
+MAX_RCPTS_PER_SESSION = 50
+# Seconds an MX host that refused or timed out a connection is passed over for its backups
+HOST_DOWN_TTL = 60
+
+# RCPT batches per second allowed against one MX provider
+MX_RATE_PER_SEC = float(os.environ.get('MX_RATE_PER_SEC', 5))
+MX_BURST = float(os.environ.get('MX_BURST', 10))
+
+# Temporary SMTP failures (greylisting, rate limiting, busy servers)
+SOFT_FAIL_CODES = {421, 450, 451, 452, 503}
+# Soft fails where the host limits the sender as a whole, not one address
+THROTTLE_CODES = {421, 452}
+
+# MX hostname suffixes of hosted mail providers that serve many customer domains
+MX_PROVIDERS = {
+    "google.com": "google",
+    "googlemail.com": "google",
+    "outlook.com": "microsoft",
+    "hotmail.com": "microsoft",
+    "yahoodns.net": "yahoo",
+    "zoho.com": "zoho",
+    "zoho.eu": "zoho",
+    "pphosted.com": "proofpoint",
+    "mimecast.com": "mimecast",
+}
+
+# Second-level labels that country TLDs register domains under (co.uk, com.au, ac.jp, ...)
+COUNTRY_SECOND_LEVELS = {
+    "ac", "co", "com", "edu", "go", "gob", "gov", "govt", "ltd", "mil", "ne", "net", "nhs", "or", "org", "plc", "sch",
+}
+
+
+class SMTPProbeError(Exception):
+    pass
+
+
+async def resolve_mx(domain: str, timeout: float = DNS_TIMEOUT) -> List[str]:
+    """MX hosts for the domain, most preferred (lowest preference value) first.
+
+    An empty list means the domain has no MX (it doesn't exist or publishes none);
+    timeouts, SERVFAIL and other transient failures raise.
+    """
+    try:
+        answer = await dns.asyncresolver.resolve(domain, 'MX', lifetime=timeout)
+    except (dns.resolver.NXDOMAIN, dns.resolver.NoAnswer):
+        return []
+    records = sorted(answer, key=lambda record: record.preference)
+    return [str(record.exchange) for record in records]
+
+
+def mx_provider(host: str) -> str:
+    """Key grouping MX hosts run by the same operator, used for connection budgets.
+
+    Known hosted-mail providers map to their name (aspmx.l.google.com and
+    alt1.aspmx.l.google.com are both "google"); other hosts are grouped by their
+    parent domain, so mx1.example.net and mx2.example.net share one budget.
+    """
+    host = host.lower().rstrip('.')
+    labels = host.split('.')
+    if len(labels) < 3 or host.replace('.', '').isdigit():
+        return host
+    for i in range(1, len(labels) - 1):
+        provider = MX_PROVIDERS.get('.'.join(labels[i:]))
+        if provider is not None:
+            return provider
+    # Keep one more label under country second-level suffixes like co.uk
+    size = 3 if len(labels[-1]) == 2 and labels[-2] in COUNTRY_SECOND_LEVELS else 2
+    return '.'.join(labels[-size:])
+
+
+class AsyncSMTP:
+    """Minimal non-blocking SMTP client, just enough for RCPT TO probing."""
+
+    def __init__(self, host: str, port: int = SMTP_PORT, timeout: float = SMTP_TIMEOUT, proxy: Optional[Proxy] = None):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.proxy = proxy
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+
+    async def connect(self) -> Tuple[int, str]:
+        if self.proxy is not None:
+            self.reader, self.writer = await open_socks_connection(self.proxy, self.host, self.port, self.timeout)
+        else:
+            self.reader, self.writer = await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.port), self.timeout
+            )
+        code, message = await self._read_reply()
+        if code != 220:
+            raise SMTPProbeError(f"unexpected greeting {code} from {self.host}")
+        return code, message
+
+    async def _read_reply(self) -> Tuple[int, str]:
+        lines = []
+        while True:
+            line = await asyncio.wait_for(self.reader.readline(), self.timeout)
+            if not line:
+                raise SMTPProbeError(f"connection closed by {self.host}")
+            line = line.decode('latin-1').rstrip('\r\n')
+            try:
+                code = int(line[:3])
+            except ValueError:
+                raise SMTPProbeError(f"malformed reply from {self.host}: {line[:50]}")
+            lines.append(line[4:])
+            if line[3:4] != '-':
+                return code, '\n'.join(lines)
+
+    async def command(self, line: str) -> Tuple[int, str]:
+        if self.writer is None:
+            raise SMTPProbeError("not connected")
+        self.writer.write(f"{line}\r\n".encode('latin-1'))
+        await asyncio.wait_for(self.writer.drain(), self.timeout)
+        return await self._read_reply()
+
+    async def helo(self, name: str = HELO_HOST) -> Tuple[int, str]:
+        return await self.command(f"HELO {name}")
+
+    async def mail(self, sender: str) -> Tuple[int, str]:
+        return await self.command(f"MAIL FROM:<{sender}>")
+
+    async def rcpt(self, address: str) -> Tuple[int, str]:
+        return await self.command(f"RCPT TO:<{address}>")
+
+    async def rset(self) -> Tuple[int, str]:
+        return await self.command("RSET")
+
+    async def quit(self):
+        try:
+            await self.command("QUIT")
+        except (OSError, asyncio.TimeoutError, SMTPProbeError):
+            pass
+        finally:
+            self.close()
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+            self.reader = None
+
+
+class SMTPSession:
+    """One HELO'd connection to an MX host that can run many MAIL FROM/RCPT TO batches."""
+
+    def __init__(self, host: str, proxy: Optional[Proxy] = None):
+        self.host = host
+        self.proxy = proxy
+        # Read at call time so the port can be pointed elsewhere (see benchmark.py)
+        self.smtp = AsyncSMTP(host, SMTP_PORT, SMTP_TIMEOUT, proxy=proxy)
+        self.connected = False
+        self.rcpt_count = 0
+        self.last_used = time.monotonic()
+        self.idle_handle: Optional[asyncio.TimerHandle] = None
+
+    async def open(self):
+        await self.smtp.connect()
+        await self.smtp.helo()
+        self.connected = True
+
+    async def probe(self, sender: str, addresses: List[str], stop_on: Optional[Callable[[int], bool]] = None) -> Dict[str, int]:
+        codes = {}
+        await self.smtp.mail(sender)
+        for address in addresses:
+            code, _ = await self.smtp.rcpt(address)
+            codes[address] = code
+            self.rcpt_count += 1
+            if code == 421:
+                # Server is closing the channel, the rest of the batch can't be trusted
+                self.connected = False
+                break
+            if stop_on is not None and stop_on(code):
+                break
+        if self.connected:
+            await self.smtp.rset()
+        self.last_used = time.monotonic()
+        return codes
+
+    @property
+    def reusable(self) -> bool:
+        return (
+            self.connected
+            and self.rcpt_count < MAX_RCPTS_PER_SESSION
+            and time.monotonic() - self.last_used < SESSION_IDLE_TIMEOUT
+        )
+
+    def close(self):
+        if self.idle_handle is not None:
+            self.idle_handle.cancel()
+            self.idle_handle = None
+        self.connected = False
+        self.smtp.close()
+
+
+class SMTPSessionPool:
+    """Keeps idle SMTP sessions per MX host, caps concurrent sessions per MX provider
+    and rate limits the RCPT batches sent to each provider."""
+
+    def __init__(self, max_per_provider: int = MAX_SESSIONS_PER_PROVIDER, idle_timeout: float = SESSION_IDLE_TIMEOUT):
+        self.max_per_provider = max_per_provider
+        self.idle_timeout = idle_timeout
+        self.rate_limiter = KeyedRateLimiter(MX_RATE_PER_SEC, MX_BURST)
+        self._idle: Dict[str, List[SMTPSession]] = {}
+        self._limits: Dict[str, asyncio.Semaphore] = {}
+        self._down: Dict[str, float] = {}
+
+    def _acquire(self, host: str, proxy: Optional[str] = None) -> Tuple[SMTPSession, bool]:
+        idle = self._idle.get(host, [])
+        # A caller asking for a specific proxy only reuses sessions opened through it
+        matching = [s for s in idle if proxy is None or (s.proxy is not None and s.proxy.url == proxy)]
+        while matching:
+            session = matching.pop()
+            idle.remove(session)
+            if session.idle_handle is not None:
+                session.idle_handle.cancel()
+                session.idle_handle = None
+            if session.reusable:
+                return session, True
+            session.close()
+        return self._new_session(host, proxy), False
+
+    def _new_session(self, host: str, proxy: Optional[str] = None) -> SMTPSession:
+        chosen = proxy_pool.resolve(proxy) if proxy else None
+        if chosen is None or not chosen.socks:
+            chosen = proxy_pool.pick(socks_only=True)
+        return SMTPSession(host, chosen)
+
+    def _release(self, session: SMTPSession):
+        if not session.reusable:
+            session.close()
+            return
+        self._idle.setdefault(session.host, []).append(session)
+        session.idle_handle = asyncio.get_running_loop().call_later(
+            self.idle_timeout, self._expire, session
+        )
+
+    def _expire(self, session: SMTPSession):
+        idle = self._idle.get(session.host, [])
+        if session in idle:
+            idle.remove(session)
+        session.idle_handle = None
+        session.close()
+
+    def is_down(self, host: str) -> bool:
+        until = self._down.get(host)
+        if until is None:
+            return False
+        if until <= time.monotonic():
+            del self._down[host]
+            return False
+        return True
+
+    async def _open(self, session: SMTPSession):
+        started = time.monotonic()
+        try:
+            await session.open()
+        except ProxyError:
+            session.proxy.record(False)
+            raise
+        except SMTPProbeError:
+            # Rejected at the greeting: through a proxy that usually means its IP is blocklisted
+            if session.proxy is not None:
+                session.proxy.record(False)
+            else:
+                self._down[session.host] = time.monotonic() + HOST_DOWN_TTL
+            raise
+        except (OSError, asyncio.TimeoutError):
+            self._down[session.host] = time.monotonic() + HOST_DOWN_TTL
+            raise
+        self._down.pop(session.host, None)
+        if session.proxy is not None:
+            session.proxy.record(True, time.monotonic() - started)
+
+    async def probe(
+        self, host: str, sender: str, addresses: List[str], stop_on: Optional[Callable[[int], bool]] = None,
+        proxy: Optional[str] = None,
+    ) -> Dict[str, Optional[int]]:
+        """RCPT TO the addresses in order over one pooled session.
+
+        A None code means the dialogue failed. When `stop_on(code)` returns True the
+        batch ends early, and addresses that were never sent are missing from the result.
+        New sessions go out through `proxy` when it is a SOCKS5 proxy, otherwise through
+        the next proxy in the pool's rotation (directly when no proxies are configured).
+        """
+        provider = mx_provider(host)
+        limit = self._limits.setdefault(provider, asyncio.Semaphore(self.max_per_provider))
+        with timed("smtp_wait"):
+            await self.rate_limiter.acquire(provider)
+            await limit.acquire()
+        SMTP_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            with timed("smtp"):
+                codes = await self._probe_session(host, sender, addresses, stop_on, proxy)
+        finally:
+            limit.release()
+            SMTP_IN_FLIGHT.dec()
+            SMTP_PROBE_SECONDS.observe(time.perf_counter() - started, provider=provider)
+        for code in codes.values():
+            SMTP_RESPONSES.inc(code=code if code is not None else "none")
+        return codes
+
+    async def _probe_session(
+        self, host: str, sender: str, addresses: List[str], stop_on: Optional[Callable[[int], bool]], proxy: Optional[str]
+    ) -> Dict[str, Optional[int]]:
+        session, reused = self._acquire(host, proxy)
+        try:
+            if not session.connected:
+                await self._open(session)
+            codes = await session.probe(sender, addresses, stop_on)
+        except (OSError, asyncio.TimeoutError, SMTPProbeError):
+            session.close()
+            if not reused:
+                return {address: None for address in addresses}
+            # The idle connection may have been dropped by the server, retry on a fresh one
+            session = self._new_session(host, proxy)
+            try:
+                await self._open(session)
+                codes = await session.probe(sender, addresses, stop_on)
+            except (OSError, asyncio.TimeoutError, SMTPProbeError):
+                session.close()
+                return {address: None for address in addresses}
+        self._release(session)
+        return codes
+
+    async def probe_mx(
+        self, hosts: List[str], sender: str, addresses: List[str], stop_on: Optional[Callable[[int], bool]] = None,
+        proxy: Optional[str] = None,
+    ) -> Dict[str, Optional[int]]:
+        """Like probe, failing over across a domain's MX hosts in preference order.
+
+        Hosts that recently refused or timed out a connection are skipped while a
+        backup is left to try; when every host is down the preferred one is tried anyway.
+        """
+        live = [host for host in hosts if not self.is_down(host)] or hosts[:1]
+        codes = {address: None for address in addresses}
+        for host in live:
+            codes = await self.probe(host, sender, addresses, stop_on, proxy)
+            if any(code is not None for code in codes.values()):
+                break
+        return codes
+
+    async def close(self):
+        idle = [session for sessions in self._idle.values() for session in sessions]
+        self._idle.clear()
+        # Stop the idle timers first, one firing would close a connection in the middle of its QUIT
+        for session in idle:
+            if session.idle_handle is not None:
+                session.idle_handle.cancel()
+                session.idle_handle = None
+        for session in idle:
+            await session.smtp.quit()
+            session.close()
+
+
+smtp_pool = SMTPSessionPool()
@@ -0,0 +1,121 @@
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Optional, Tuple
+
+from pymongo import ReplaceOne
+
+from domain_cache import DNS_ERROR_TTL, NO_MX_TTL
+from metrics import CACHE_REQUESTS, timed
+
+logger = logging.getLogger(__name__)
+
+# Seconds each kind of verdict may be reused for
+VERDICT_TTLS = {
+    "valid": 7 * 86400,
+    "invalid": 30 * 86400,
+    "risky": 86400,
+}
+SOFT_FAIL_TTL = 3600
+
+
+@dataclass
+class CacheLookup:
+    """How one request or job uses the verdict cache, and what it got out of it."""
+
+    max_age: Optional[float] = None  # seconds; older verdicts are re-probed
+    force: bool = False  # ignore cached verdicts (fresh results are still stored)
+    hits: int = 0
+    misses: int = 0
+
+
+def normalise_email(email: str) -> str:
+    return email.strip().lower()
+
+
+def verdict_ttl(status: str, reason: str) -> int:
+    # DNS outcomes belong to the domain, and last no longer than the domain cache keeps them
+    if reason == "no_mx":
+        return NO_MX_TTL
+    if reason == "dns_error":
+        return DNS_ERROR_TTL
+    # Timeouts and greylisting say nothing lasting about the address
+    if status == "risky" and (reason == "smtp_timeout" or reason.startswith("smtp_soft_fail")):
+        return SOFT_FAIL_TTL
+    return VERDICT_TTLS.get(status, SOFT_FAIL_TTL)
+
+
+class VerdictCache:
+    """Per-address verification verdicts shared across requests, jobs and users."""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def ensure_indexes(self):
+        try:
+            await self.collection.create_index("expires_at", expireAfterSeconds=0)
+        except Exception as e:
+            logger.warning(f"Could not create verdict cache index: {e}")
+
+    async def get_many(self, emails: Iterable[str], lookup: CacheLookup) -> Dict[str, Tuple[str, str]]:
+        """Fresh cached verdicts for the addresses, keyed by the addresses as given."""
+        emails = list(emails)
+        if lookup.force or not emails:
+            lookup.misses += len(emails)
+            CACHE_REQUESTS.inc(len(emails), cache="verdict", result="miss")
+            return {}
+
+        now = datetime.utcnow()
+        query = {
+            "_id": {"$in": [normalise_email(email) for email in emails]},
+            "expires_at": {"$gt": now},
+        }
+        if lookup.max_age is not None:
+            query["checked_at"] = {"$gte": now - timedelta(seconds=lookup.max_age)}
+
+        try:
+            with timed("verdict_cache"):
+                docs = {doc["_id"]: doc async for doc in self.collection.find(query)}
+        except Exception as e:
+            logger.warning(f"Verdict cache read failed: {e}")
+            docs = {}
+
+        found = {}
+        for email in emails:
+            doc = docs.get(normalise_email(email))
+            if doc is not None:
+                found[email] = (doc["status"], doc["reason"])
+        lookup.hits += len(found)
+        lookup.misses += len(emails) - len(found)
+        CACHE_REQUESTS.inc(len(found), cache="verdict", result="hit")
+        CACHE_REQUESTS.inc(len(emails) - len(found), cache="verdict", result="miss")
+        return found
+
+    async def get(self, email: str, lookup: CacheLookup) -> Optional[Tuple[str, str]]:
+        return (await self.get_many([email], lookup)).get(email)
+
+    async def put_many(self, verdicts: Dict[str, Tuple[str, str]]):
+        if not verdicts:
+            return
+        now = datetime.utcnow()
+        operations = []
+        for email, (status, reason) in verdicts.items():
+            key = normalise_email(email)
+            operations.append(ReplaceOne(
+                {"_id": key},
+                {
+                    "_id": key,
+                    "status": status,
+                    "reason": reason,
+                    "checked_at": now,
+                    "expires_at": now + timedelta(seconds=verdict_ttl(status, reason)),
+                },
+                upsert=True,
+            ))
+        try:
+            await self.collection.bulk_write(operations, ordered=False)
+        except Exception as e:
+            logger.warning(f"Verdict cache write failed: {e}")
+
+    async def put(self, email: str, status: str, reason: str):
+        await self.put_many({email: (status, reason)})
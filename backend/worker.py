@@ -0,0 +1,130 @@
+"""Bulk job runner.
+
+Runs N worker processes that claim queued bulk jobs from the Mongo job store
+and process them outside the API process:
+
+    python worker.py --workers 4
+
+Each worker holds a renewable lease on the job it runs. On SIGTERM/SIGINT the
+workers stop claiming, flush finished rows and release their job so another
+runner resumes it; a worker that dies without releasing is replaced, and its
+job is picked up again once the lease expires.
+"""
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import time
+
+from job_store import LEASE_SECONDS
+
+# Worker processes started by default
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+# Seconds an idle worker waits before looking for a new job
+POLL_INTERVAL = 2
+
+logger = logging.getLogger(__name__)
+
+
+async def keep_lease(job_store, job_id: str, worker_id: str):
+    while True:
+        await asyncio.sleep(LEASE_SECONDS / 3)
+        await job_store.renew_lease(job_id, worker_id)
+
+
+async def worker_loop(worker_id: str, stop: asyncio.Event):
+    # Imported here so every spawned process sets up its own Mongo client and SMTP pool
+    from server import job_store, run_job, smtp_pool, client, db
+    from metrics import publish_loop
+
+    # Job runners' metrics reach /api/metrics through the snapshots they publish
+    publisher = asyncio.create_task(publish_loop(db.metrics))
+    try:
+        while not stop.is_set():
+            job = await job_store.claim_job(worker_id)
+            if job is None:
+                try:
+                    await asyncio.wait_for(stop.wait(), POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            job_id = job['job_id']
+            logger.info(f"{worker_id} running job {job_id}")
+            task = asyncio.create_task(run_job(job))
+            heartbeat = asyncio.create_task(keep_lease(job_store, job_id, worker_id))
+            stopping = asyncio.create_task(stop.wait())
+            await asyncio.wait({task, stopping}, return_when=asyncio.FIRST_COMPLETED)
+            heartbeat.cancel()
+            stopping.cancel()
+
+            if not task.done():
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+                await job_store.release_job(job_id, worker_id)
+                logger.info(f"{worker_id} released job {job_id}")
+            elif task.exception() is not None:
+                logger.error(f"{worker_id} job {job_id} crashed: {task.exception()}")
+    finally:
+        publisher.cancel()
+        await smtp_pool.close()
+        client.close()
+
+
+async def run_worker_async():
+    worker_id = f"{socket.gethostname()}-{os.getpid()}"
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    await worker_loop(worker_id, stop)
+
+
+def run_worker():
+    asyncio.run(run_worker_async())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run bulk verification/finding jobs")
+    parser.add_argument('--workers', type=int, default=JOB_WORKERS)
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+    context = multiprocessing.get_context('spawn')
+    processes = [None] * args.workers
+    stopping = False
+
+    def shutdown(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for process in processes:
+            if process is not None and process.is_alive():
+                process.terminate()
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+
+    # Keep N workers alive, replacing any that die
+    while not stopping:
+        for i, process in enumerate(processes):
+            if process is None or not process.is_alive():
+                if process is not None:
+                    logger.warning(f"Job worker {process.pid} exited with {process.exitcode}, restarting")
+                processes[i] = context.Process(target=run_worker, name=f"job-worker-{i}")
+                processes[i].start()
+        time.sleep(1)
+
+    for process in processes:
+        if process is not None:
+            process.join()
+
+
+if __name__ == "__main__":
+    main()
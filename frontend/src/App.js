@@ -15,6 +15,7 @@ function App() {
   const [jobProgress, setJobProgress] = useState(null);
   const [proxies, setProxies] = useState("");
   const [currentProxy, setCurrentProxy] = useState("");
+  const [proxyPool, setProxyPool] = useState(null);
   
   // Single verify form
   const [singleEmail, setSingleEmail] = useState("");
@@ -30,25 +31,62 @@ function App() {
   const verifyFileRef = useRef(null);
   const findFileRef = useRef(null);
 
-  // Poll job progress
+  // Stream job progress, falling back to polling if the event stream is unavailable
   useEffect(() => {
     let interval;
+    let source;
     if (jobId && jobProgress?.status === "processing") {
-      interval = setInterval(async () => {
-        try {
-          const response = await axios.get(`${API}/job-progress/${jobId}`);
-          setJobProgress(response.data);
-          if (response.data.status === "completed" || response.data.status === "error") {
-            clearInterval(interval);
+      const poll = () => {
+        interval = setInterval(async () => {
+          try {
+            const response = await axios.get(`${API}/job-progress/${jobId}`);
+            setJobProgress(response.data);
+            if (response.data.status === "completed" || response.data.status === "error") {
+              clearInterval(interval);
+            }
+          } catch (err) {
+            console.error("Error fetching progress:", err);
           }
-        } catch (err) {
-          console.error("Error fetching progress:", err);
-        }
-      }, 1000);
+        }, 1000);
+      };
+
+      if (window.EventSource) {
+        source = new EventSource(`${API}/job-events/${jobId}?rows=false`);
+        source.addEventListener("progress", (event) => setJobProgress(JSON.parse(event.data)));
+        source.addEventListener("done", (event) => {
+          setJobProgress(JSON.parse(event.data));
+          source.close();
+        });
+        source.onerror = () => {
+          // EventSource reconnects by itself; only fall back once it has given up
+          if (source.readyState === EventSource.CLOSED) {
+            poll();
+          }
+        };
+      } else {
+        poll();
+      }
     }
-    return () => clearInterval(interval);
+    return () => {
+      clearInterval(interval);
+      if (source) {
+        source.close();
+      }
+    };
   }, [jobId, jobProgress?.status]);
 
+  const handleSaveProxies = async () => {
+    setError("");
+    try {
+      const response = await axios.post(`${API}/proxies`, {
+        proxies: proxies.split('\n').map(p => p.trim()).filter(p => p)
+      });
+      setProxyPool(response.data.proxies);
+    } catch (err) {
+      setError(err.response?.data?.detail || "Error saving proxies");
+    }
+  };
+
   const handleSingleVerify = async () => {
     setLoading(true);
     setError("");
@@ -258,6 +296,19 @@ function App() {
                 value={proxies}
                 onChange={(e) => setProxies(e.target.value)}
               />
+              <div className="flex items-center justify-between">
+                <button
+                  onClick={handleSaveProxies}
+                  className="px-4 py-2 text-sm font-medium text-white bg-gradient-to-r from-purple-500 to-pink-500 rounded-lg hover:from-purple-600 hover:to-pink-600 transition-all duration-200"
+                >
+                  Save to Rotation Pool
+                </button>
+                {proxyPool && (
+                  <span className="text-sm text-slate-500">
+                    {proxyPool.length} proxies in rotation, {proxyPool.filter(p => p.state === "open").length} cooling down
+                  </span>
+                )}
+              </div>
             </div>
             <div className="space-y-3">
               <label className="block text-sm font-medium text-slate-700">
@@ -268,7 +319,7 @@ function App() {
                 value={currentProxy}
                 onChange={(e) => setCurrentProxy(e.target.value)}
               >
-                <option value="">No Proxy</option>
+                <option value="">Rotate Pool (direct if empty)</option>
                 {proxies.split('\n').filter(p => p.trim()).map((proxy, idx) => (
                   <option key={idx} value={proxy.trim()}>{proxy.trim()}</option>
                 ))}
@@ -372,7 +423,7 @@ function App() {
                 <div className="flex justify-between items-center">
                   <div>
                     <h3 className="text-2xl font-bold text-slate-900 mb-2">Bulk Email Verification</h3>
-                    <p className="text-slate-600">Process up to 1000 email addresses from CSV files</p>
+                    <p className="text-slate-600">Process up to 1,000,000 email addresses from CSV files</p>
                   </div>
                   <button
                     onClick={() => downloadTemplate("verify")}
@@ -386,7 +437,7 @@ function App() {
                 <div className="max-w-md mx-auto space-y-6">
                   <div className="space-y-2">
                     <label className="block text-sm font-medium text-slate-700">
-                      Upload CSV File <span className="text-slate-400">(max 1000 records)</span>
+                      Upload CSV File <span className="text-slate-400">(max 1,000,000 records)</span>
                     </label>
                     <div className="relative">
                       <input
@@ -489,7 +540,7 @@ function App() {
                 <div className="flex justify-between items-center">
                   <div>
                     <h3 className="text-2xl font-bold text-slate-900 mb-2">Bulk Email Finding</h3>
-                    <p className="text-slate-600">Find emails for up to 1000 records using pattern generation</p>
+                    <p className="text-slate-600">Find emails for up to 1,000,000 records using pattern generation</p>
                   </div>
                   <button
                     onClick={() => downloadTemplate("find")}
@@ -503,7 +554,7 @@ function App() {
                 <div className="max-w-md mx-auto space-y-6">
                   <div className="space-y-2">
                     <label className="block text-sm font-medium text-slate-700">
-                      Upload CSV File <span className="text-slate-400">(max 1000 records)</span>
+                      Upload CSV File <span className="text-slate-400">(max 1,000,000 records)</span>
                     </label>
                     <div className="relative">
                       <input
@@ -573,6 +624,20 @@ function App() {
                       <p className="font-medium text-slate-900 mb-1">Found Email</p>
                       <p className="text-lg text-slate-700">{result.found_email}</p>
                       <p className="text-sm text-slate-500 mt-1">{result.reason}</p>
+                      {result.candidates && (
+                        <div className="mt-3 text-sm text-slate-600">
+                          <p className="font-medium text-amber-700">
+                            Catch-all domain: best guess, {Math.round(result.confidence * 100)}% confidence
+                          </p>
+                          <ul className="mt-1 space-y-0.5">
+                            {result.candidates.map((candidate) => (
+                              <li key={candidate.email}>
+                                {candidate.email} <span className="text-slate-400">({Math.round(candidate.confidence * 100)}%)</span>
+                              </li>
+                            ))}
+                          </ul>
+                        </div>
+                      )}
                     </div>
                   )}
                   {result.found_email === null && result.reason && (
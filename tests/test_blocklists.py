@@ -0,0 +1,94 @@
+import os
+
+import pytest
+
+import blocklists
+from blocklists import Blocklist, SortedIndex, _normalise
+
+
+def index_of(entries):
+    block = _normalise(entries)
+    return SortedIndex(block, len(block))
+
+
+def test_sorted_index_finds_every_entry_and_nothing_else():
+    entries = [f"domain{i:05d}.example" for i in range(0, 3000, 3)]
+    index = index_of(entries)
+    assert index.entries == len(entries)
+    for i in range(3000):
+        assert (f"domain{i:05d}.example" in index) == (i % 3 == 0)
+    # Neighbours, prefixes and extensions of entries
+    for key in ("", "a", "domain", "domain00000.exampl", "domain00000.examplex", "zzz", "domain02999.example"):
+        assert key not in index
+
+
+@pytest.mark.parametrize("entries", [["only.example"], ["a", "b"], ["b", "a", "c"]])
+def test_sorted_index_edges(entries):
+    index = index_of(entries)
+    for entry in entries:
+        assert entry in index
+    assert "0" not in index and "z" not in index
+
+
+def test_empty_index():
+    index = index_of([])
+    assert index.entries == 0
+    assert "anything" not in index
+
+
+def test_normalise_strips_comments_case_and_leading_dots():
+    index = index_of(["# header", "Mailinator.COM  # comment", ".tempmail.org", "", "mailinator.com"])
+    assert index.entries == 2
+    assert "mailinator.com" in index and "tempmail.org" in index
+
+
+def test_suffix_matching():
+    domains = Blocklist("disposable", None, ["mailinator.com", "co.uk"], match_suffixes=True)
+    assert "mailinator.com" in domains
+    assert " X.Mailinator.com " in domains
+    assert "a.b.mailinator.com" in domains
+    assert "notmailinator.com" not in domains
+    assert "mailinator.com.evil.net" not in domains
+    # A bare TLD is never a parent match, but listed second-level suffixes are
+    assert "example.co.uk" in domains
+    assert "" not in domains
+
+
+def test_exact_matching_without_suffixes():
+    roles = Blocklist("role", None, ["info", "no-reply"])
+    assert "INFO" in roles
+    assert "info.team" not in roles
+    roles.reload()
+    assert roles.stats()["source"] == "built-in"
+
+
+@pytest.fixture
+def index_dir(tmp_path, monkeypatch):
+    directory = tmp_path / "indexes"
+    monkeypatch.setattr(blocklists, "INDEX_DIR", directory)
+    return directory
+
+
+def test_file_list_is_compiled_and_reloaded(tmp_path, index_dir):
+    source = tmp_path / "disposable.txt"
+    source.write_text("mailinator.com\n")
+    domains = Blocklist("disposable", str(source), ["default.example"], match_suffixes=True)
+    assert "x.mailinator.com" in domains
+    assert "default.example" not in domains
+    assert len(list(index_dir.glob("*.idx"))) == 1
+
+    source.write_text("mailinator.com\nyopmail.com\n")
+    os.utime(source, ns=(source.stat().st_atime_ns, source.stat().st_mtime_ns + 10**9))
+    # Changes are only noticed at the next check, or on reload
+    assert "yopmail.com" not in domains
+    domains.reload()
+    assert "yopmail.com" in domains
+    assert domains.stats() == {"source": str(source), "entries": 2, "bytes": len(_normalise(["mailinator.com", "yopmail.com"]))}
+    # The index of the earlier version is cleaned up
+    assert len(list(index_dir.glob("*.idx"))) == 1
+
+
+def test_missing_file_falls_back_to_defaults(tmp_path, index_dir):
+    domains = Blocklist("disposable", str(tmp_path / "missing.txt"), ["default.example"])
+    assert "default.example" in domains
+    assert domains.stats()["entries"] == 1
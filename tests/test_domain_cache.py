@@ -0,0 +1,67 @@
+import asyncio
+
+import dns.exception
+import dns.resolver
+
+import domain_cache
+from domain_cache import DNS_ERROR_TTL, NO_MX_TTL, DomainCache
+from verdict_cache import VERDICT_TTLS, verdict_ttl
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def stub_resolver(monkeypatch, outcomes):
+    calls = []
+
+    async def resolve_mx(domain, timeout=10):
+        calls.append(domain)
+        outcome = outcomes[domain]
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    monkeypatch.setattr(domain_cache, "resolve_mx", resolve_mx)
+    return calls
+
+
+def test_get_mx_tells_missing_mx_from_failed_lookup(monkeypatch):
+    stub_resolver(monkeypatch, {
+        "example.com": ["mx1.example.com", "mx2.example.com"],
+        "nomx.example": [],
+        "slow.example": dns.exception.Timeout(),
+        "broken.example": dns.resolver.NoNameservers(),
+    })
+    cache = DomainCache()
+    assert run(cache.get_mx("example.com")) == ["mx1.example.com", "mx2.example.com"]
+    assert run(cache.get_mx("nomx.example")) == []
+    assert run(cache.get_mx("slow.example")) is None
+    assert run(cache.get_mx("broken.example")) is None
+
+
+def test_prefetch_mx_only_reports_domains_without_mx(monkeypatch):
+    stub_resolver(monkeypatch, {
+        "example.com": ["mx.example.com"],
+        "nomx.example": [],
+        "slow.example": dns.exception.Timeout(),
+    })
+    dead = run(DomainCache().prefetch_mx(["example.com", "NoMX.example", "slow.example"]))
+    assert dead == {"nomx.example"}
+
+
+def test_get_mx_loads_each_domain_once(monkeypatch):
+    calls = stub_resolver(monkeypatch, {"example.com": ["mx.example.com"]})
+    cache = DomainCache()
+
+    async def lookups():
+        return await asyncio.gather(*(cache.get_mx("example.com") for _ in range(10)))
+
+    assert run(lookups()) == [["mx.example.com"]] * 10
+    assert calls == ["example.com"]
+
+
+def test_dns_verdicts_expire_with_the_domain_cache():
+    assert verdict_ttl("invalid", "no_mx") == NO_MX_TTL
+    assert verdict_ttl("risky", "dns_error") == DNS_ERROR_TTL
+    assert verdict_ttl("invalid", "smtp_reject") == VERDICT_TTLS["invalid"]
@@ -0,0 +1,36 @@
+import asyncio
+
+from job_store import JobWriter
+
+
+class SlowStore:
+    """Records what reaches the store; the first batch takes longest to commit."""
+
+    def __init__(self):
+        self.seqs = []
+        self.progress = []
+        self.delays = [0.05]
+
+    async def add_rows(self, job_id, rows):
+        await asyncio.sleep(self.delays.pop() if self.delays else 0)
+        self.seqs.extend(row["seq"] for row in rows)
+
+    async def update_job(self, job_id, **fields):
+        self.progress.append(fields["current_row"])
+
+
+def test_concurrent_flushes_commit_in_seq_order():
+    store = SlowStore()
+
+    async def main():
+        writer = JobWriter(store, "job", batch_size=2, flush_interval=60)
+
+        async def add(seq):
+            await writer.add(seq, ["x"], "valid", seq=seq, current_row=seq)
+
+        await asyncio.gather(*(add(seq) for seq in range(1, 9)))
+        await writer.flush()
+
+    asyncio.run(main())
+    assert store.seqs == list(range(1, 9))
+    assert store.progress == sorted(store.progress)
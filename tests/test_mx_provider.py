@@ -0,0 +1,23 @@
+import pytest
+
+from smtp_probe import mx_provider
+
+
+@pytest.mark.parametrize("host, provider", [
+    ("aspmx.l.google.com.", "google"),
+    ("ALT1.ASPMX.L.GOOGLE.COM", "google"),
+    ("example-com.mail.protection.outlook.com", "microsoft"),
+    ("mx1.example.net", "example.net"),
+    ("mx2.example.net", "example.net"),
+    ("mx.example.co.uk", "example.co.uk"),
+    ("mail.example.com.au", "example.com.au"),
+    # Short second-level names under a country TLD are ordinary domains
+    ("mx00.gmx.de", "gmx.de"),
+    ("mx01.gmx.de", "gmx.de"),
+    ("mx-ha03.web.de", "web.de"),
+    ("mx.a.de", "a.de"),
+    ("example.com", "example.com"),
+    ("192.0.2.1", "192.0.2.1"),
+])
+def test_mx_provider(host, provider):
+    assert mx_provider(host) == provider
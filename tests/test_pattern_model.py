@@ -0,0 +1,58 @@
+import asyncio
+
+import pytest
+
+from pattern_model import DEFAULT_PRIORS, PatternModel, pattern_of
+
+AsyncMongoMockClient = pytest.importorskip("mongomock_motor").AsyncMongoMockClient
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_pattern_of():
+    assert pattern_of("Ann.Lee@example.com", "Ann", "Lee") == "first.last"
+    assert pattern_of("lee_ann@example.com", "Ann", "Lee") is None
+    assert pattern_of("ann_lee@example.com", "Ann", "Lee") == "first_last"
+
+
+def test_rare_formats_are_not_tried_at_unseen_domains():
+    model = PatternModel(AsyncMongoMockClient().db.email_patterns)
+
+    async def scenario():
+        for email in ("lee.ann@a.com", "ann_lee@b.com", "lee@c.com", "ann-lee@d.com"):
+            await model.record(email, "Ann", "Lee")
+        return await model.ranked("Bo", "Kim", "unseen.com")
+
+    ranked = run(scenario())
+    assert len(ranked) == len(DEFAULT_PRIORS)
+    assert ranked[0][0] == "bo.kim@unseen.com"
+    assert abs(sum(p for _, p in ranked) - 1) < 1e-9
+
+
+def test_domain_evidence_reorders_and_prunes_candidates():
+    model = PatternModel(AsyncMongoMockClient().db.email_patterns)
+
+    async def scenario():
+        for first, last in (("ann", "lee"), ("bo", "kim"), ("cy", "park"), ("di", "wu")):
+            await model.record(f"{first}_{last}@corp.com", first, last)
+        return await model.candidates("Ed", "Ng", "corp.com")
+
+    candidates = run(scenario())
+    assert candidates[0] == "ed_ng@corp.com"
+    # The domain's own format dominates, the unlikely defaults are cut
+    assert len(candidates) < len(DEFAULT_PRIORS)
+
+
+def test_recording_an_address_twice_counts_once():
+    collection = AsyncMongoMockClient().db.email_patterns
+    model = PatternModel(collection)
+
+    async def scenario():
+        await model.record("ann.lee@corp.com", "Ann", "Lee")
+        await model.record("ann.lee@corp.com", "Ann", "Lee")
+        return await collection.find_one({"_id": "corp.com"})
+
+    doc = run(scenario())
+    assert doc["counts"] == {"first:last": 1}
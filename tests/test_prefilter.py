@@ -0,0 +1,66 @@
+import csv
+import os
+
+import pytest
+
+pytest.importorskip("pandas")
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "helpfinder_test")
+
+import server  # noqa: E402
+from prefilter import DUPLICATE, PROBE, VERDICTS, prefilter_emails  # noqa: E402
+
+ADDRESSES = [
+    "ann@example.com",
+    " Ann@Example.com ",
+    "",
+    "not-an-address",
+    "two@@example.com",
+    "someone@mailinator.com",
+    "someone@sub.MAILINATOR.com",
+    "Info@example.com",
+    "noreply@example.org",
+    "bob@example.org",
+    "ann@example.com",
+    "x@com",
+]
+
+
+def write_upload(path, emails):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["name", "Email"])
+        writer.writerows([f"row{i}", email] for i, email in enumerate(emails))
+
+
+def test_prefilter_agrees_with_precheck(tmp_path):
+    path = tmp_path / "upload.csv"
+    write_upload(path, ADDRESSES)
+    result = prefilter_emails(path, "Email", server.EMAIL_REGEX, server.disposable_domains, server.role_prefixes)
+
+    for i, email in enumerate(ADDRESSES):
+        email = email.strip()
+        expected = server.precheck_email(email) if email else ("invalid", "empty_email")
+        kind = int(result.kinds[i])
+        if kind in (PROBE, DUPLICATE):
+            assert expected is None, email
+        else:
+            assert VERDICTS[kind] == expected, email
+
+
+def test_prefilter_collapses_repeats_onto_the_first_row(tmp_path):
+    path = tmp_path / "upload.csv"
+    write_upload(path, ADDRESSES)
+    result = prefilter_emails(path, "Email", server.EMAIL_REGEX, server.disposable_domains, server.role_prefixes)
+
+    assert result.kinds[0] == PROBE
+    assert result.kinds[1] == DUPLICATE and result.first_of[1] == 0
+    assert result.kinds[10] == DUPLICATE and result.first_of[10] == 0
+    assert result.first_of[9] == -1
+    assert result.domains == {"example.com", "example.org"}
+
+
+def test_prefilter_gives_up_on_a_missing_column(tmp_path):
+    path = tmp_path / "upload.csv"
+    write_upload(path, ADDRESSES)
+    assert prefilter_emails(path, "mail", server.EMAIL_REGEX, server.disposable_domains, server.role_prefixes) is None
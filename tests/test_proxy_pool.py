@@ -0,0 +1,43 @@
+import time
+
+from proxy_pool import CIRCUIT_FAILURES, ProxyPool
+
+
+def pool_with(*urls):
+    pool = ProxyPool()
+    pool.load(list(urls))
+    return pool
+
+
+def trip(proxy):
+    for _ in range(CIRCUIT_FAILURES):
+        proxy.record(False)
+    # Cooldown over: the proxy is half-open
+    proxy.open_until = time.monotonic() - 1
+
+
+def test_half_open_proxy_lets_one_trial_through():
+    pool = pool_with("socks5://10.0.0.1:1080", "socks5://10.0.0.2:1080")
+    broken, healthy = pool.proxies
+    trip(broken)
+    assert broken.stats()["state"] == "half_open"
+
+    picks = [pool.pick() for _ in range(200)]
+    assert picks.count(broken) == 1
+    assert broken.stats()["state"] == "half_open"
+
+    # The trial's outcome closes the circuit again
+    broken.record(True, 0.1)
+    assert broken.stats()["state"] == "closed"
+    assert broken in {pool.pick() for _ in range(200)}
+
+
+def test_failed_trial_reopens_the_circuit():
+    pool = pool_with("socks5://10.0.0.1:1080", "socks5://10.0.0.2:1080")
+    broken, healthy = pool.proxies
+    trip(broken)
+    while pool.pick() is not broken:
+        pass
+    broken.record(False)
+    assert broken.stats()["state"] == "open"
+    assert {pool.pick() for _ in range(50)} == {healthy}
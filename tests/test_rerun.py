@@ -0,0 +1,135 @@
+import asyncio
+import csv
+import os
+
+import pytest
+
+pytest.importorskip("pandas")
+AsyncMongoMockClient = pytest.importorskip("mongomock_motor").AsyncMongoMockClient
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "helpfinder_test")
+
+import csv_stream  # noqa: E402
+import server  # noqa: E402
+from fastapi import HTTPException  # noqa: E402
+from job_store import JobStore  # noqa: E402
+from server import FIND_RESULT_COLUMNS, VERIFY_RESULT_COLUMNS, RerunRequest, rerun_filter  # noqa: E402
+
+
+@pytest.fixture
+def store(monkeypatch, tmp_path):
+    db = AsyncMongoMockClient().db
+    store = JobStore(db)
+    monkeypatch.setattr(server, "db", db)
+    monkeypatch.setattr(server, "job_store", store)
+    monkeypatch.setattr(csv_stream, "UPLOAD_DIR", tmp_path / "uploads")
+    return store
+
+
+@pytest.fixture
+def runs(monkeypatch):
+    """Stands in for the verify pipeline: records the upload and the rows left to process."""
+    runs = []
+
+    async def process(job_id, path, email_field, total, cache):
+        with open(path, newline="", encoding="utf-8") as f:
+            upload = list(csv.reader(f))
+        done = await server.job_store.completed_rows(job_id, total)
+        runs.append({"upload": upload, "todo": [i for i in range(total) if not done[i]]})
+        await server.job_store.update_job(job_id, status="completed")
+
+    monkeypatch.setattr(server, "process_bulk_verification", process)
+    return runs
+
+
+async def finished_job(store, job_id, status, input_columns, columns, rows):
+    await store.create_job(job_id, "verify", "a.csv", 3, "done", params={"email_field": "email"})
+    await store.update_job(job_id, status=status, columns=columns, input_columns=input_columns)
+    await store.add_rows(job_id, [
+        {"index": i, "seq": i + 1, "status": values[columns.index("status")], "values": values}
+        for i, values in rows
+    ])
+
+
+async def rerun(store, job_id, **request):
+    queued = await server.rerun_job(job_id, RerunRequest(**request))
+    job = await store.get_job(queued["job_id"])
+    # The API only queues the job, the runner copies the upload and rows
+    assert await store.rows.count_documents({"job_id": job["job_id"]}) == 0
+    await server.run_job(job)
+    return await store.get_job(job["job_id"])
+
+
+def test_default_statuses_per_job_type():
+    verify_columns = ["email", *VERIFY_RESULT_COLUMNS]
+    keep = rerun_filter(verify_columns, "verify", None, None)
+    assert not keep(["a@x.com", "risky", "smtp_timeout"])
+    assert keep(["b@x.com", "valid", "smtp_ok"])
+    assert keep(["c@x.com", "invalid", "smtp_reject"])
+
+    find_columns = ["firstname", "lastname", "domain", *FIND_RESULT_COLUMNS]
+    keep = rerun_filter(find_columns, "find", None, None)
+    assert not keep(["Ann", "Lee", "x.com", "Not Found", "not_found", "not_valid_email_found", "", ""])
+    assert keep(["Bo", "Kim", "x.com", "bo@x.com", "found", "found_pattern_smtp_ok", 1.0, ""])
+
+
+def test_reasons_narrow_the_statuses():
+    keep = rerun_filter(["email", *VERIFY_RESULT_COLUMNS], "verify", ["risky"], ["smtp_timeout"])
+    assert not keep(["a@x.com", "risky", "smtp_timeout"])
+    assert keep(["b@x.com", "risky", "smtp_soft_fail_451"])
+    assert keep(["c@x.com", "invalid", "smtp_timeout"])
+
+
+def test_runner_skips_carried_rows(store, runs, tmp_path):
+    upload = tmp_path / "a.csv"
+    upload.write_text("email\na@x.com\nb@x.com\nc@x.com\n")
+    columns = ["email", *VERIFY_RESULT_COLUMNS]
+
+    async def scenario():
+        # The job failed after two rows, its upload is kept
+        await finished_job(store, "old", "error", ["email"], columns, [
+            (0, ["a@x.com", "valid", "smtp_ok"]),
+            (1, ["b@x.com", "risky", "smtp_timeout"]),
+        ])
+        await store.save_upload("old", upload)
+        first = await rerun(store, "old")
+        # The earlier job keeps its upload, so it can be re-run again
+        second = await rerun(store, "old", statuses=["valid"])
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert runs[0]["todo"] == [1, 2]
+    assert runs[1]["todo"] == [0, 2]
+    assert runs[0]["upload"] == [["email"], ["a@x.com"], ["b@x.com"], ["c@x.com"]]
+    assert first["current_row"] == 1 and first["params"]["rerun_of"] == "old"
+    assert second["params"]["statuses"] == ["valid"]
+
+
+def test_rebuilt_upload_keeps_a_column_shared_with_the_results(store, runs):
+    # The upload's own "status" column was replaced in place by the result status
+    columns = ["status", "email", "reason"]
+    rows = [
+        (0, ["valid", "a@x.com", "smtp_ok"]),
+        (1, ["risky", "b@x.com", "smtp_timeout"]),
+        (2, ["invalid", "c@x.com", "smtp_reject"]),
+    ]
+
+    async def scenario():
+        await finished_job(store, "old", "completed", ["status", "email"], columns, rows)
+        assert not await store.has_upload("old")
+        return await rerun(store, "old")
+
+    job = asyncio.run(scenario())
+    assert runs[0]["upload"] == [["status", "email"], ["valid", "a@x.com"], ["risky", "b@x.com"], ["invalid", "c@x.com"]]
+    assert runs[0]["todo"] == [1]
+    assert job["status"] == "completed"
+
+
+def test_rerun_needs_an_upload(store):
+    async def scenario():
+        await finished_job(store, "old", "error", ["email"], ["email", *VERIFY_RESULT_COLUMNS], [])
+        await server.rerun_job("old", RerunRequest())
+
+    with pytest.raises(HTTPException) as e:
+        asyncio.run(scenario())
+    assert e.value.status_code == 400
@@ -0,0 +1,124 @@
+import asyncio
+
+import retry_queue
+from retry_queue import RetryQueue
+
+
+def make_queue(outcomes, done, max_attempts=4):
+    """Queue whose retries return the next outcome listed for the item."""
+    async def retry(item):
+        return outcomes[item].pop(0)
+
+    async def on_done(item, result):
+        done.append((item, result))
+
+    return RetryQueue(retry, lambda result: result == "soft", on_done, max_attempts)
+
+
+def test_delay_depends_on_the_items_own_attempt(monkeypatch):
+    monkeypatch.setattr(retry_queue, "RETRY_BASE_DELAY", 5)
+    monkeypatch.setattr(retry_queue, "RETRY_MAX_DELAY", 300)
+
+    async def scenario():
+        queue = make_queue({}, [])
+        # Many first-time soft fails at once all get the base delay
+        delays = [queue.defer(i) for i in range(12)]
+        later = [queue.defer("x", attempt) for attempt in (2, 3, 4, 8)]
+        queue.cancel()
+        return delays, later
+
+    delays, later = asyncio.run(scenario())
+    assert delays == [5] * 12
+    assert later == [10, 20, 40, 300]
+
+
+def test_retries_until_settled_or_out_of_attempts(monkeypatch):
+    monkeypatch.setattr(retry_queue, "RETRY_BASE_DELAY", 0.001)
+    done = []
+
+    async def scenario():
+        queue = make_queue({"a": ["soft", "ok"], "b": ["soft"] * 5}, done, max_attempts=3)
+        queue.defer("a")
+        queue.defer("b")
+        assert len(queue) == 2
+        await queue.drain()
+        assert len(queue) == 0
+
+    asyncio.run(scenario())
+    assert sorted(done) == [("a", "ok"), ("b", "soft")]
+
+
+def test_throttled_provider_pauses_its_retries(monkeypatch):
+    monkeypatch.setattr(retry_queue, "RETRY_BASE_DELAY", 5)
+    monkeypatch.setattr(retry_queue, "RETRY_MAX_DELAY", 300)
+
+    async def scenario():
+        queue = make_queue({}, [])
+        # A burst of 421s counts once, while the pause is running
+        first = [queue.throttle("google") for _ in range(5)]
+        parked = queue.defer("a", attempt=1, key="google")
+        elsewhere = queue.defer("b", attempt=1, key="example.net")
+        queue._paused_until["google"] = 0
+        again = queue.throttle("google")
+        queue.cancel()
+        return first, parked, elsewhere, again
+
+    first, parked, elsewhere, again = asyncio.run(scenario())
+    assert first[0] == 5 and all(4.9 < pause <= 5 for pause in first)
+    assert 4.9 < parked <= 5
+    assert elsewhere == 5
+    assert again == 10
+
+
+def test_retry_results_throttle_and_release_the_provider(monkeypatch):
+    monkeypatch.setattr(retry_queue, "RETRY_BASE_DELAY", 0.01)
+    done = []
+
+    async def retry(item):
+        return outcomes[item].pop(0)
+
+    async def on_done(item, result):
+        done.append((item, result))
+
+    outcomes = {"a": ["throttled", "ok"], "b": ["ok"]}
+
+    async def scenario():
+        queue = RetryQueue(
+            retry, lambda result: result != "ok", on_done, is_throttled=lambda result: result == "throttled"
+        )
+        queue.defer("a", key="google")
+        await asyncio.sleep(0.015)
+        assert queue.paused_for("google") > 0
+        # Parked behind the provider's pause, not just its own delay
+        queue.defer("b", key="google")
+        await queue.drain()
+        return queue
+
+    queue = asyncio.run(scenario())
+    assert sorted(done) == [("a", "ok"), ("b", "ok")]
+    assert "google" not in queue._strikes
+
+
+def test_retries_in_flight_are_capped(monkeypatch):
+    monkeypatch.setattr(retry_queue, "RETRY_BASE_DELAY", 0.001)
+    running = []
+    peak = []
+
+    async def retry(item):
+        running.append(item)
+        peak.append(len(running))
+        await asyncio.sleep(0.01)
+        running.remove(item)
+        return "ok"
+
+    async def on_done(item, result):
+        pass
+
+    async def scenario():
+        queue = RetryQueue(retry, lambda result: result != "ok", on_done, concurrency=3)
+        for i in range(12):
+            queue.defer(i, key="google")
+        await queue.drain()
+
+    asyncio.run(scenario())
+    assert max(peak) == 3
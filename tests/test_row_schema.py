@@ -0,0 +1,39 @@
+import csv
+import io
+
+from job_store import RowSchema
+
+
+def read_rows(text):
+    return list(csv.DictReader(io.StringIO(text)))
+
+
+def test_result_columns_follow_the_upload_columns():
+    schema = RowSchema(["name", "email"], ["status", "reason"])
+    assert schema.columns == ["name", "email", "status", "reason"]
+    assert schema.input_columns == ["name", "email"]
+    row = read_rows("name,email\nAnn,ann@example.com\n")[0]
+    assert schema.values(row, "valid", "smtp_ok") == ["Ann", "ann@example.com", "valid", "smtp_ok"]
+
+
+def test_result_column_named_like_an_upload_column_replaces_it_in_place():
+    schema = RowSchema(["status", "email", "note"], ["status", "reason"])
+    assert schema.columns == ["status", "email", "note", "reason"]
+    row = read_rows("status,email,note\nold,ann@example.com,x\n")[0]
+    assert schema.values(row, "invalid", "smtp_reject") == ["invalid", "ann@example.com", "x", "smtp_reject"]
+
+
+def test_ragged_rows_fit_the_schema():
+    schema = RowSchema(["name", "email"], ["status", "reason"])
+    short, long = read_rows("name,email\nAnn\nBob,bob@example.com,extra,fields\n")
+    assert schema.values(short, "invalid", "empty_email") == ["Ann", None, "invalid", "empty_email"]
+    assert schema.values(long, "valid", "smtp_ok") == ["Bob", "bob@example.com", "valid", "smtp_ok"]
+
+
+def test_status_and_reason_are_interned():
+    schema = RowSchema(["email"], ["found_email", "status", "reason", "confidence"])
+    reason = "".join(["smtp", "_ok"])
+    first = schema.values({"email": "a"}, "a@example.com", "found", reason, 1.0)
+    second = schema.values({"email": "b"}, "b@example.com", "found", "".join(["smtp", "_ok"]), 0.5)
+    assert first[3] is second[3]
+    assert first[1] == "a@example.com" and first[4] == 1.0